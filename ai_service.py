@@ -6,33 +6,192 @@ AI Service: GPT-4o + Claude Dual Model with Code-Switching Support
 import logging
 import asyncio
 import re
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
-from anthropic import Anthropic
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, FrozenSet, List, NamedTuple, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
 
 from config import (
     settings, 
-    CRISIS_KEYWORDS_AR, 
-    CRISIS_KEYWORDS_EN, 
-    CRISIS_KEYWORDS_MIXED,
+    CRISIS_KEYWORDS_ALL,
     OMANI_CULTURAL_PHRASES,
     OMANI_CODESWITCHING_PHRASES,
     CODESWITCHING_PATTERNS,
     CODESWITCHING_CBT_TECHNIQUES
 )
+from conversation_store import create_conversation_store
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the app entrypoint
 logger = logging.getLogger(__name__)
 
+# Whisper spells Arabic inconsistently (hamza forms, alef maqsura, taa marbuta, harakat, tatweel),
+# so messages and keywords are folded the same way before matching
+_ARABIC_NORMALIZATION = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "’": "'",
+    "\u0640": None, "\u0670": None,
+    **{chr(codepoint): None for codepoint in range(0x064B, 0x0660)}
+})
+
+def _normalize_text(text_lower: str) -> str:
+    """Fold spelling variants of lowercased text for keyword matching and cache keys"""
+    return text_lower.translate(_ARABIC_NORMALIZATION)
+
+# Transcription noise ignored on top of the normalization: punctuation, spacing. Crisis matching
+# and the response cache key fold text the same way, so "cant go on" is caught as "can't go on"
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def _fold_for_matching(text_normalized: str) -> str:
+    """Drop punctuation and collapse spacing in normalized text"""
+    return _WHITESPACE_PATTERN.sub(" ", _PUNCTUATION_PATTERN.sub("", text_normalized)).strip()
+
+def _minimal_keywords(keywords: FrozenSet[str]) -> List[str]:
+    """Drop keywords that contain another keyword, since the shorter one already matches"""
+    return sorted(
+        keyword for keyword in keywords
+        if not any(other != keyword and other in keyword for other in keywords)
+    )
+
+# All crisis keywords compiled into one alternation so detection is a single C-level scan
+_CRISIS_KEYWORDS_NORMALIZED = _minimal_keywords(
+    frozenset(_fold_for_matching(_normalize_text(keyword)) for keyword in CRISIS_KEYWORDS_ALL)
+)
+_CRISIS_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in _CRISIS_KEYWORDS_NORMALIZED))
+
+# Messages shorter than every keyword ("ok", "نعم") cannot contain one, so they skip the scan
+_MIN_CRISIS_KEYWORD_LENGTH = min(len(keyword) for keyword in _CRISIS_KEYWORDS_NORMALIZED)
+
+# Script presence checks and code-switching indicators, also scanned in C
+_ARABIC_CHAR_PATTERN = re.compile(r"[\u0600-\u06FF]")
+_ENGLISH_CHAR_PATTERN = re.compile(r"[A-Za-z]")
+_CODESWITCHING_PATTERN = re.compile("|".join(
+    re.escape(_normalize_text(pattern.lower()))
+    for patterns in CODESWITCHING_PATTERNS.values()
+    for pattern in patterns
+))
+
+# Markers of a culturally grounded reply, and of a generic English refusal that needs Claude
+_CULTURAL_MARKER_PATTERN = re.compile("|".join(
+    re.escape(marker) for marker in ("الله", "السلام", "مرحب", "أهلا", "I understand")
+))
+_REFUSAL_PATTERN = re.compile(r"as an ai|i'm sorry, but|i can't help|i cannot help", re.IGNORECASE)
+
+# Sentence ends in English and Arabic punctuation, where a reply cut off by max_tokens is trimmed back to
+_SENTENCE_END_PATTERN = re.compile(r"[.!?؟۔]")
+
+def _trim_to_last_sentence(text: str) -> str:
+    """Drop a trailing unfinished sentence, keeping the text whole when it has no sentence end"""
+    last_end = None
+    for last_end in _SENTENCE_END_PATTERN.finditer(text):
+        pass
+    return text[:last_end.end()] if last_end else text
+
+# Markers a Claude rewrite must contain before it replaces the GPT reply
+_CLAUDE_ACCEPT_PATTERN = re.compile("|".join(
+    re.escape(marker) for marker in ("مرحباً", "السلام", "I understand")
+))
+
+class _MessageAnalysis(NamedTuple):
+    """Everything the per-turn routing needs to know about the user's message"""
+    crisis_detected: bool
+    is_codeswitching: bool
+    has_arabic: bool
+    has_english: bool
+
 class AIService:
     """Handles dual-model AI responses with GPT-4o primary and Claude fallback, supporting code-switching"""
     
+    # Claude validation instructions; static per code-switching mode so the system block can be cached
+    _VALIDATION_INSTRUCTIONS = """
+        As an expert in Arabic mental health counseling and Omani culture, evaluate the conversation turn the user sends you.
+        {codeswitching_context}
+
+        Please:
+        1. Ensure cultural appropriateness for Omani/Gulf context
+        2. Verify therapeutic quality and empathy
+        3. Check Islamic sensitivity if relevant
+        4. Improve Arabic dialect authenticity
+        5. Enhance crisis response if needed
+        6. If code-switching detected, respond naturally with appropriate Arabic-English mixing
+
+        Provide the best possible response in Omani Arabic dialect, incorporating Islamic counseling principles where appropriate.
+        Keep response under 200 words and maintain warm, supportive tone.
+        """
+    
+    # Per-turn fields of the validation request, filled in with format_map
+    _VALIDATION_TEMPLATE = """
+        User (may contain code-switching): {user_message}
+        AI Response: {gpt_response}
+        Crisis Detected: {crisis_detected}
+        Code-switching Detected: {is_codeswitching}
+        """
+    
+    _CODESWITCHING_VALIDATION_CONTEXT = """
+            
+            IMPORTANT: The user is using code-switching (mixing Arabic and English), which is natural in Gulf Arabic conversation.
+            Your response should also naturally incorporate code-switching where appropriate, reflecting how educated Gulf Arabs speak.
+            Use English for modern concepts, technical terms, or when it feels natural, while maintaining Arabic for cultural and emotional expressions.
+            """
+    
     def __init__(self):
         """Initialize AI services"""
-        self.openai_client = OpenAI(api_key=settings.openai_api_key) if settings.openai_api_key else None
-        self.anthropic_client = Anthropic(api_key=settings.anthropic_api_key) if settings.anthropic_api_key else None
-        self.conversation_history: List[Dict[str, str]] = []
+        # One pooled HTTP/2 client shared by both SDKs so concurrent calls multiplex over
+        # kept-alive connections instead of paying TCP+TLS setup per request
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            # Voice turns are tens of seconds apart, far beyond httpx's 5s default idle expiry
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=300),
+            timeout=httpx.Timeout(10.0)
+        )
+        # The SDKs apply their own per-request timeout over the pool's, so set it here once
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=self.http_client,
+            timeout=10.0
+        ) if settings.openai_api_key else None
+        self.anthropic_client = AsyncAnthropic(
+            api_key=settings.anthropic_api_key,
+            http_client=self.http_client,
+            timeout=10.0
+        ) if settings.anthropic_api_key else None
+        # Caps in-flight GPT calls across all conversations sharing this service
+        self._openai_semaphore = asyncio.Semaphore(settings.openai_max_concurrent)
+        # Per-conversation history; backed by Redis when configured so any worker can serve a turn
+        self.conversation_store = create_conversation_store()
+        
+        # The system prompt only varies with the code-switching flag, so render both once
+        self._system_prompt_plain = self._build_system_prompt(False)
+        self._system_prompt_codeswitching = self._build_system_prompt(True)
+        self._system_message_plain = {"role": "system", "content": self._system_prompt_plain}
+        self._system_message_codeswitching = {"role": "system", "content": self._system_prompt_codeswitching}
+        
+        # Claude system blocks, prerendered with a cache breakpoint so Anthropic can reuse the prefix
+        self._claude_system_plain = self._cached_text_blocks(self._system_prompt_plain)
+        self._claude_system_codeswitching = self._cached_text_blocks(self._system_prompt_codeswitching)
+        self._validation_system_plain = self._cached_text_blocks(
+            self._VALIDATION_INSTRUCTIONS.format_map({"codeswitching_context": ""})
+        )
+        self._validation_system_codeswitching = self._cached_text_blocks(
+            self._VALIDATION_INSTRUCTIONS.format_map({"codeswitching_context": self._CODESWITCHING_VALIDATION_CONTEXT})
+        )
+        
+        # Fallbacks only vary with the crisis and code-switching flags, so render all four once
+        self._fallback_responses: Dict[Tuple[bool, bool], str] = {
+            (crisis_detected, is_codeswitching): self._build_fallback_response(crisis_detected, is_codeswitching)
+            for crisis_detected in (False, True)
+            for is_codeswitching in (False, True)
+        }
+        
+        # LRU of final responses keyed on the recent history plus the new message
+        self._response_cache: "OrderedDict[Tuple[Tuple[Tuple[str, str], ...], str], str]" = OrderedDict()
+        
+        # Smoothed GPT-4o latency, used to decide when a slow call is worth hedging with Claude
+        self._gpt_latency_ewma: Optional[float] = None
+        
+        # History writes still in flight, per conversation; the next turn waits on its own
+        self._pending_appends: Dict[str, asyncio.Task] = {}
     
     async def get_response(self, user_message: str, conversation_id: str) -> Dict[str, Any]:
         """
@@ -45,41 +204,64 @@ class AIService:
         Returns:
             Dict with response and metadata
         """
-        start_time = asyncio.get_event_loop().time()
+        start_time = time.perf_counter()
+        
+        # Lowercase and normalize once and share it between the analysis and the cache key
+        text_normalized = _normalize_text(user_message.lower())
+        
+        # Analysis is microseconds, so it runs inline; its flags decide which models to call,
+        # and the error path below reuses them
+        analysis = self._analyze_message(user_message, text_normalized)
+        crisis_detected = analysis.crisis_detected
+        is_codeswitching = analysis.is_codeswitching
         
         try:
-            # Detect crisis first (includes code-switching patterns)
-            crisis_detected = self._detect_crisis(user_message)
+            # The previous turn's history write usually finished while its reply was being spoken
+            await self._wait_for_pending_append(conversation_id)
+            history = await self.conversation_store.get_messages(conversation_id)
             
-            # Detect code-switching in user message
-            is_codeswitching = self._detect_codeswitching(user_message)
+            # Crisis turns never read or write the cache: they always get a fresh crisis response
+            cache_key = None if crisis_detected else self._response_cache_key(text_normalized, history)
+            cached_response = None if cache_key is None else self._response_cache.get(cache_key)
             
-            # Get primary response from GPT-4o
-            primary_response = await self._get_gpt_response(user_message, is_codeswitching)
+            if crisis_detected:
+                # Crisis turns always want Claude, so ask both models at once instead of in sequence
+                final_response, model_used = await self._get_parallel_response(
+                    user_message, history, is_codeswitching
+                )
+            elif cached_response is not None:
+                # A hit skips both LLM round-trips
+                self._response_cache.move_to_end(cache_key)
+                final_response = cached_response
+                model_used = "response-cache"
+            else:
+                primary_response, model_used = await self._race_llms(user_message, history, is_codeswitching)
+                
+                # Validate/enhance with Claude only when GPT's reply fails the local checks
+                if model_used != "gpt-4o":
+                    final_response = primary_response
+                elif self._gpt_response_good_enough(primary_response, crisis_detected, is_codeswitching):
+                    final_response = primary_response
+                    model_used = "gpt-4o"
+                else:
+                    final_response = await self._validate_with_claude(
+                        user_message, 
+                        primary_response, 
+                        crisis_detected,
+                        is_codeswitching
+                    )
+                    model_used = "gpt-4o + claude-validation-codeswitching"
+                
+                self._cache_response(cache_key, final_response)
             
-            # Validate/enhance with Claude if needed
-            final_response = await self._validate_with_claude(
-                user_message, 
-                primary_response, 
-                crisis_detected,
-                is_codeswitching
+            # Update conversation history while the caller moves on to speech synthesis
+            self._append_in_background(
+                conversation_id,
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": final_response}
             )
             
-            # Update conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message
-            })
-            self.conversation_history.append({
-                "role": "assistant", 
-                "content": final_response
-            })
-            
-            # Keep conversation history manageable
-            if len(self.conversation_history) > 20:
-                self.conversation_history = self.conversation_history[-20:]
-            
-            processing_time = asyncio.get_event_loop().time() - start_time
+            processing_time = time.perf_counter() - start_time
             
             return {
                 "success": True,
@@ -87,114 +269,236 @@ class AIService:
                 "crisis_detected": crisis_detected,
                 "is_codeswitching": is_codeswitching,
                 "processing_time": processing_time,
-                "model_used": "gpt-4o + claude-validation-codeswitching"
+                "model_used": model_used
             }
             
         except Exception as e:
-            logger.error(f"AI response error: {e}")
+            logger.error("AI response error: %s", e)
             
             # Fallback response
-            fallback_response = self._get_fallback_response(user_message)
+            fallback_response = self._get_fallback_response(crisis_detected, is_codeswitching)
             
             return {
                 "success": False,
                 "response": fallback_response,
-                "crisis_detected": self._detect_crisis(user_message),
-                "is_codeswitching": self._detect_codeswitching(user_message),
-                "processing_time": asyncio.get_event_loop().time() - start_time,
+                "crisis_detected": crisis_detected,
+                "is_codeswitching": is_codeswitching,
+                "processing_time": time.perf_counter() - start_time,
                 "error": str(e),
                 "model_used": "fallback-codeswitching"
             }
     
-    async def _get_gpt_response(self, user_message: str, is_codeswitching: bool = False) -> str:
+    async def _get_gpt_response(self, user_message: str, history: List[Dict[str, str]], is_codeswitching: bool = False) -> str:
         """Get response from GPT-4o with Omani cultural context and code-switching support"""
+        try:
+            start_time = time.perf_counter()
+            parts = []
+            finish_reason = None
+            async for delta, finish_reason in self._stream_gpt_response(user_message, history, is_codeswitching):
+                parts.append(delta)
+            self._record_gpt_latency(time.perf_counter() - start_time)
+            
+            response = "".join(parts).strip()
+            if finish_reason == "length":
+                # Cut off by max_tokens: never cache or speak a half sentence
+                logger.warning("GPT-4o reply hit max_tokens - trimming to the last full sentence")
+                response = _trim_to_last_sentence(response)
+            return response
+            
+        except Exception as e:
+            logger.error("GPT-4o error: %s", e)
+            raise
+    
+    async def _stream_gpt_response(self, user_message: str, history: List[Dict[str, str]], is_codeswitching: bool = False) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """Stream GPT-4o response text as it is decoded, each piece paired with the finish reason once known"""
         
-        system_prompt = self._create_system_prompt(is_codeswitching)
-        
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = [self._system_message_codeswitching if is_codeswitching else self._system_message_plain]
         
-        # Add conversation history
-        messages.extend(self.conversation_history[-10:])  # Last 10 exchanges
+        # Add the conversation window; it only grows between truncations so the prefix stays cacheable
+        messages.extend(history)
         
         # Add current message
         messages.append({"role": "user", "content": user_message})
         
-        try:
-            if not self.openai_client:
-                raise Exception("OpenAI API key not configured")
-            
-            response = self.openai_client.chat.completions.create(
+        if not self.openai_client:
+            raise Exception("OpenAI API key not configured")
+        
+        async with self._openai_semaphore:
+            stream = await self.openai_client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
-                max_tokens=300,
+                # The system prompt caps replies at 150 words, about 220 GPT-4o tokens of Arabic;
+                # a reply that still runs over is trimmed back to its last full sentence
+                max_tokens=220,
                 temperature=0.7,
-                timeout=10
+                stream=True
             )
             
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.error(f"GPT-4o error: {e}")
-            raise
+            async for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta.content or choice.finish_reason:
+                        yield choice.delta.content or "", choice.finish_reason
+    
+    async def _get_claude_response(self, user_message: str, history: List[Dict[str, str]], is_codeswitching: bool = False) -> str:
+        """Get an independent response from Claude with the same Omani context as GPT"""
+        if not self.anthropic_client:
+            raise Exception("Anthropic API key not configured")
+        
+        # The history only grows between truncations, so mark its end as a second cache breakpoint
+        messages = list(history)
+        if messages:
+            messages[-1] = {"role": messages[-1]["role"], "content": self._cached_text_blocks(messages[-1]["content"])}
+        messages.append({"role": "user", "content": user_message})
+        
+        response = await self.anthropic_client.messages.create(
+            model="claude-sonnet-4-20250514",
+            max_tokens=300,
+            temperature=0.6,
+            system=self._claude_system_codeswitching if is_codeswitching else self._claude_system_plain,
+            messages=messages
+        )
+        
+        return response.content[0].text.strip()
+    
+    async def _race_llms(self, user_message: str, history: List[Dict[str, str]], is_codeswitching: bool = False) -> Tuple[str, str]:
+        """Start GPT-4o and, if it fails or runs past the hedge delay, race Claude against it"""
+        gpt_start = time.perf_counter()
+        gpt_task = asyncio.create_task(self._get_gpt_response(user_message, history, is_codeswitching))
+        hedge_delay = self._hedge_delay()
+        
+        if hedge_delay is None or not self.anthropic_client:
+            return await gpt_task, "gpt-4o"
+        
+        done, _ = await asyncio.wait({gpt_task}, timeout=hedge_delay)
+        if done:
+            if gpt_task.exception() is None:
+                return gpt_task.result(), "gpt-4o"
+            # A fast failure (429, 5xx) should not cost the user the reply; Claude answers alone
+            logger.warning("GPT-4o failed within the hedge delay - falling back to Claude: %s", gpt_task.exception())
+            return await self._get_claude_response(user_message, history, is_codeswitching), "claude-fallback"
+        
+        logger.info("GPT-4o slower than %.2fs - hedging with Claude", hedge_delay)
+        claude_task = asyncio.create_task(self._get_claude_response(user_message, history, is_codeswitching))
+        pending = {gpt_task, claude_task}
+        error = None
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer GPT when both land in the same wakeup
+                for task, model_used in ((gpt_task, "gpt-4o"), (claude_task, "claude-hedge")):
+                    if task in done:
+                        if task.exception() is None:
+                            return task.result(), model_used
+                        error = error or task.exception()
+            raise error
+        finally:
+            # Free the losing request's connection
+            for task in pending:
+                task.cancel()
+            # A GPT call that lost the race still took at least this long; without the sample the
+            # EWMA only sees fast calls and keeps hedging every turn during a slowdown
+            if gpt_task in pending:
+                self._record_gpt_latency(time.perf_counter() - gpt_start)
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait on GPT-4o before hedging, or None when hedging is disabled"""
+        if settings.llm_hedge_delay <= 0:
+            return None
+        if self._gpt_latency_ewma is None:
+            return settings.llm_hedge_delay
+        # Hedge once GPT runs well past its recent typical latency, never later than the cap
+        return min(settings.llm_hedge_delay, 2 * self._gpt_latency_ewma)
+    
+    def _record_gpt_latency(self, latency: float):
+        """Fold a GPT-4o call's latency, or the time it ran before losing the race, into the EWMA"""
+        if self._gpt_latency_ewma is None:
+            self._gpt_latency_ewma = latency
+        else:
+            self._gpt_latency_ewma = 0.8 * self._gpt_latency_ewma + 0.2 * latency
+    
+    async def _get_parallel_response(self, user_message: str, history: List[Dict[str, str]], is_codeswitching: bool = False) -> Tuple[str, str]:
+        """Ask GPT-4o and Claude concurrently; prefer Claude's reply when it passes the accept check"""
+        gpt_result, claude_result = await asyncio.gather(
+            self._get_gpt_response(user_message, history, is_codeswitching),
+            self._get_claude_response(user_message, history, is_codeswitching),
+            return_exceptions=True
+        )
+        
+        claude_ok = not isinstance(claude_result, BaseException)
+        if claude_ok and self._claude_response_acceptable(claude_result):
+            return claude_result, "claude-parallel"
+        if not isinstance(gpt_result, BaseException):
+            return gpt_result, "gpt-4o"
+        if claude_ok:
+            return claude_result, "claude-parallel"
+        
+        logger.warning("Claude parallel error: %s", claude_result)
+        raise gpt_result
+    
+    def _claude_response_acceptable(self, claude_response: str) -> bool:
+        """Check that a Claude reply is substantial and carries an Omani greeting or empathy marker"""
+        return len(claude_response) > 50 and _CLAUDE_ACCEPT_PATTERN.search(claude_response) is not None
+    
+    def _gpt_response_good_enough(self, gpt_response: str, crisis_detected: bool, is_codeswitching: bool = False) -> bool:
+        """Decide locally whether a GPT reply can skip Claude validation"""
+        # Crisis turns always get the second opinion; the flag lets A/B runs validate every turn
+        if crisis_detected or not settings.enable_local_quality_gate:
+            return False
+        
+        # A mixed-language user should get a reply that mixes back
+        if is_codeswitching and _ENGLISH_CHAR_PATTERN.search(gpt_response) is None:
+            return False
+        
+        return (
+            len(gpt_response) > 50
+            and _ARABIC_CHAR_PATTERN.search(gpt_response) is not None
+            and _CULTURAL_MARKER_PATTERN.search(gpt_response) is not None
+            and _REFUSAL_PATTERN.search(gpt_response) is None
+        )
     
     async def _validate_with_claude(self, user_message: str, gpt_response: str, crisis_detected: bool, is_codeswitching: bool = False) -> str:
         """Validate and enhance GPT response with Claude, supporting code-switching"""
         
-        codeswitching_context = ""
-        if is_codeswitching:
-            codeswitching_context = """
-            
-            IMPORTANT: The user is using code-switching (mixing Arabic and English), which is natural in Gulf Arabic conversation.
-            Your response should also naturally incorporate code-switching where appropriate, reflecting how educated Gulf Arabs speak.
-            Use English for modern concepts, technical terms, or when it feels natural, while maintaining Arabic for cultural and emotional expressions.
-            """
-        
-        validation_prompt = f"""
-        As an expert in Arabic mental health counseling and Omani culture, evaluate this conversation:
-
-        User (may contain code-switching): {user_message}
-        AI Response: {gpt_response}
-        Crisis Detected: {crisis_detected}
-        Code-switching Detected: {is_codeswitching}
-        {codeswitching_context}
-
-        Please:
-        1. Ensure cultural appropriateness for Omani/Gulf context
-        2. Verify therapeutic quality and empathy
-        3. Check Islamic sensitivity if relevant
-        4. Improve Arabic dialect authenticity
-        5. Enhance crisis response if needed
-        6. If code-switching detected, respond naturally with appropriate Arabic-English mixing
-
-        Provide the best possible response in Omani Arabic dialect, incorporating Islamic counseling principles where appropriate.
-        Keep response under 200 words and maintain warm, supportive tone.
-        """
+        validation_prompt = self._VALIDATION_TEMPLATE.format_map({
+            "user_message": user_message,
+            "gpt_response": gpt_response,
+            "crisis_detected": crisis_detected,
+            "is_codeswitching": is_codeswitching
+        })
         
         try:
             if not self.anthropic_client:
                 logger.warning("Anthropic API key not configured - skipping Claude validation")
                 return gpt_response
             
-            response = self.anthropic_client.messages.create(
+            response = await self.anthropic_client.messages.create(
                 model="claude-sonnet-4-20250514",
                 max_tokens=300,
                 temperature=0.6,
+                system=self._validation_system_codeswitching if is_codeswitching else self._validation_system_plain,
                 messages=[{"role": "user", "content": validation_prompt}]
             )
             
             claude_response = response.content[0].text.strip()
             
             # Use Claude's enhanced response if it's significantly better
-            if len(claude_response) > 50 and ("مرحباً" in claude_response or "السلام" in claude_response or "I understand" in claude_response):
+            if self._claude_response_acceptable(claude_response):
                 return claude_response
             else:
                 return gpt_response
                 
         except Exception as e:
-            logger.warning(f"Claude validation error: {e}")
+            logger.warning("Claude validation error: %s", e)
             return gpt_response  # Fallback to GPT response
     
-    def _create_system_prompt(self, is_codeswitching: bool = False) -> str:
+    @staticmethod
+    def _cached_text_blocks(text: str) -> List[Dict[str, Any]]:
+        """Wrap text as an Anthropic content block list ending in an ephemeral cache breakpoint"""
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+    
+    def _build_system_prompt(self, is_codeswitching: bool = False) -> str:
         """Create system prompt for Omani mental health context with code-switching support"""
         
         codeswitching_instructions = ""
@@ -238,58 +542,45 @@ class AIService:
         حافظ على ردودك قصيرة ومفيدة (أقل من 150 كلمة) لتناسب المحادثة الصوتية.
         """
     
-    def _detect_crisis(self, text: str) -> bool:
-        """Detect crisis keywords in Arabic, English, and code-switching patterns"""
-        text_lower = text.lower()
-        
-        # Check Arabic crisis keywords
-        for keyword in CRISIS_KEYWORDS_AR:
-            if keyword in text_lower:
-                return True
-        
-        # Check English crisis keywords
-        for keyword in CRISIS_KEYWORDS_EN:
-            if keyword in text_lower:
-                return True
-        
-        # Check code-switching crisis patterns
-        for keyword in CRISIS_KEYWORDS_MIXED:
-            if keyword.lower() in text_lower:
-                return True
-        
-        return False
-    
-    def _detect_codeswitching(self, text: str) -> bool:
-        """Detect if text contains Arabic-English code-switching patterns"""
+    def _analyze_message(self, text: str, text_normalized: Optional[str] = None) -> _MessageAnalysis:
+        """Detect crisis keywords and Arabic-English code-switching in one call"""
         if not text:
-            return False
+            return _MessageAnalysis(False, False, False, False)
+        if text_normalized is None:
+            text_normalized = _normalize_text(text.lower())
         
-        # Check if text contains both Arabic and English characters
-        has_arabic = any('\u0600' <= char <= '\u06FF' for char in text)
-        has_english = any(char.isalpha() and ord(char) < 128 for char in text)
+        # Crisis keywords in Arabic, English, and code-switching patterns
+        text_folded = _fold_for_matching(text_normalized)
+        crisis_detected = (
+            len(text_folded) >= _MIN_CRISIS_KEYWORD_LENGTH
+            and _CRISIS_PATTERN.search(text_folded) is not None
+        )
         
-        # Check for common code-switching patterns
-        text_lower = text.lower()
-        codeswitching_indicators = 0
+        # Check if text contains both Arabic and English characters
+        has_arabic = _ARABIC_CHAR_PATTERN.search(text) is not None
+        has_english = _ENGLISH_CHAR_PATTERN.search(text) is not None
         
-        for category, patterns in CODESWITCHING_PATTERNS.items():
-            for pattern in patterns:
-                if pattern.lower() in text_lower:
-                    codeswitching_indicators += 1
+        # Count distinct code-switching patterns in a single pass
+        codeswitching_indicators = len(set(_CODESWITCHING_PATTERN.findall(text_normalized)))
         
         # If we have both scripts or multiple indicators
         is_mixed = (has_arabic and has_english) or codeswitching_indicators >= 2
         
         if is_mixed:
-            logger.info(f"🌐 Code-switching detected in AI: AR={has_arabic}, EN={has_english}, indicators={codeswitching_indicators}")
+            logger.info(
+                "🌐 Code-switching detected in AI: AR=%s, EN=%s, indicators=%d",
+                has_arabic, has_english, codeswitching_indicators
+            )
         
-        return is_mixed
+        return _MessageAnalysis(crisis_detected, is_mixed, has_arabic, has_english)
     
-    def _get_fallback_response(self, user_message: str) -> str:
+    def _get_fallback_response(self, crisis_detected: bool, is_codeswitching: bool) -> str:
+        """Return the prerendered fallback response for the turn's crisis and code-switching flags"""
+        return self._fallback_responses[(crisis_detected, is_codeswitching)]
+    
+    def _build_fallback_response(self, crisis_detected: bool, is_codeswitching: bool) -> str:
         """Generate fallback response for system errors with code-switching support"""
-        is_codeswitching = self._detect_codeswitching(user_message)
-        
-        if self._detect_crisis(user_message):
+        if crisis_detected:
             if is_codeswitching:
                 return f"""
                 {OMANI_CODESWITCHING_PHRASES['comfort_mixed']}
@@ -329,10 +620,65 @@ class AIService:
                 هل يمكنك إعادة ما قلته؟ أنا هنا لأستمع إليك وأساعدك.
                 """
     
-    def clear_conversation(self):
+    def _response_cache_key(self, text_normalized: str, history: List[Dict[str, str]]) -> Tuple[Tuple[Tuple[str, str], ...], str]:
+        """Build the response cache key from the last 4 history messages and the normalized new message"""
+        recent = tuple((message["role"], message["content"]) for message in history[-4:])
+        return recent, _fold_for_matching(text_normalized)
+    
+    def _cache_response(self, cache_key: Tuple[Tuple[Tuple[str, str], ...], str], response: str):
+        """Store a final response, evicting the least recently used entry when full"""
+        if settings.response_cache_size <= 0:
+            return
+        self._response_cache[cache_key] = response
+        if len(self._response_cache) > settings.response_cache_size:
+            self._response_cache.popitem(last=False)
+    
+    async def warm_up(self):
+        """Open pooled connections to both providers so the first turn skips TCP/TLS setup"""
+        urls = [str(client.base_url) for client in (self.openai_client, self.anthropic_client) if client]
+        results = await asyncio.gather(*(self.http_client.head(url) for url in urls), return_exceptions=True)
+        
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                logger.warning("Connection warm-up failed for %s: %s", url, result)
+    
+    async def keep_warm(self, interval: float):
+        """Warm the pool now and touch it every `interval` seconds so idle connections stay open"""
+        while True:
+            await self.warm_up()
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+    
+    async def aclose(self):
+        """Close the shared HTTP connection pool"""
+        await self.http_client.aclose()
+    
+    def _append_in_background(self, conversation_id: str, *messages: Dict[str, str]):
+        """Write a finished turn to the store without holding up the response"""
+        task = asyncio.create_task(self.conversation_store.append(conversation_id, *messages))
+        self._pending_appends[conversation_id] = task
+        task.add_done_callback(lambda done: self._finish_append(conversation_id, done))
+    
+    def _finish_append(self, conversation_id: str, task: asyncio.Task):
+        """Forget a completed history write and log it if it failed"""
+        if self._pending_appends.get(conversation_id) is task:
+            del self._pending_appends[conversation_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Conversation history write failed - %s: %s", conversation_id, task.exception())
+    
+    async def _wait_for_pending_append(self, conversation_id: str):
+        """Wait for the conversation's in-flight history write, if any; failures are already logged"""
+        task = self._pending_appends.get(conversation_id)
+        if task is not None:
+            await asyncio.wait([task])
+    
+    async def clear_conversation(self, conversation_id: str):
         """Clear conversation history"""
-        self.conversation_history = []
-        logger.info("Conversation history cleared")
+        # Let an in-flight write land first so it cannot resurrect the cleared history
+        await self._wait_for_pending_append(conversation_id)
+        await self.conversation_store.clear(conversation_id)
+        logger.info("Conversation history cleared - %s", conversation_id)
 
 # Global AI service instance
 ai_service = AIService()
@@ -342,6 +688,10 @@ async def get_ai_response(user_message: str, conversation_id: str) -> Dict[str,
     """Convenience function for getting AI response"""
     return await ai_service.get_response(user_message, conversation_id)
 
-def clear_conversation_history():
+async def warm_up_ai_connections():
+    """Convenience function to open and keep warm the LLM connections"""
+    await ai_service.keep_warm(settings.llm_keepalive_interval)
+
+async def clear_conversation_history(conversation_id: str):
     """Convenience function to clear conversation history"""
-    ai_service.clear_conversation() 
\ No newline at end of file
+    await ai_service.clear_conversation(conversation_id) 
\ No newline at end of file
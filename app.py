@@ -5,14 +5,20 @@ Main Streamlit Application
 """
 
 import streamlit as st
-import asyncio
 import base64
 import logging
+import queue
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, NamedTuple, Optional
 
 # Import bot components
-from mental_health_bot import process_user_voice, get_bot_stats, test_bot_system, reset_bot_session
+from mental_health_bot import OmaniMentalHealthBot, warm_up_crisis_audio
+from ai_service import warm_up_ai_connections
+from speech_service import warm_up_speech_connections
+from background_loop import run_coroutine_with_updates, submit_coroutine
+from session_store import forget_session, load_session_turns, parse_session_id, save_session_turn
 from config import settings
 
 # Audio recording component
@@ -35,8 +41,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
+# Custom CSS; a module constant, emitted through st.html so reruns skip markdown parsing.
+# Whitespace is collapsed once at import, since the whole block is re-sent on every rerun
+_CUSTOM_CSS = " ".join("""
 <style>
     .main-header {
         text-align: center;
@@ -97,91 +104,175 @@ st.markdown("""
         box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
     }
 </style>
-""", unsafe_allow_html=True)
+""".split())
+
+# Static page content, built once at import rather than on every rerun
+_HEADER_HTML = """
+<div class="main-header">
+    <h1>🧠 المساعد النفسي العماني</h1>
+    <h2>Omani Mental Health Assistant</h2>
+    <p>مساعد الصحة النفسية الذكي باللهجة العمانية الأصيلة</p>
+    <p>Voice-Only AI Mental Health Support in Authentic Omani Arabic</p>
+</div>
+"""
+
+_EMERGENCY_NUMBERS_MD = """
+**Oman Emergency Numbers:**
+- 🚨 Police: **9999**
+- 🏥 Mental Health: **24673000**
+- 🩺 Ministry of Health: **24602077**
+"""
+
+_WELCOME_MESSAGE = """
+### 🌟 Welcome | أهلاً وسهلاً
+
+**Voice-Only Mental Health Support in Omani Arabic**
+**دعم الصحة النفسية بالصوت فقط باللهجة العمانية**
+
+Click the microphone above and start speaking in Omani Arabic.
+اضغط على الميكروفون أعلاه وابدأ بالتحدث بالعربية العمانية.
+
+I'm here to listen and provide culturally sensitive mental health support.
+أنا هنا لأستمع إليك وأقدم لك الدعم النفسي المناسب ثقافياً.
+"""
+
+_FOOTER_HTML = """
+<div style="text-align: center; padding: 1rem; color: #666;">
+    <p>🔒 Your privacy is protected | خصوصيتك محمية</p>
+    <p>For emergencies, call 9999 | في حالة الطوارئ، اتصل بـ 9999</p>
+</div>
+"""
+
+_SUCCESS_STATUS_TEMPLATE = """
+<div class="success-message">
+    ✅ <strong>Response processed in {processing_time:.2f}s</strong>
+</div>
+"""
+
+_CRISIS_ALERT_HTML = """
+<div class="crisis-alert">
+    🚨 <strong>Crisis Support Activated</strong><br>
+    Emergency resources have been included in the response.
+</div>
+"""
+
+# Only the newest turns are shown; older ones (and their audio) are dropped from session state
+_HISTORY_DISPLAY_LIMIT = 5
+
+class HistoryEntry(NamedTuple):
+    """One displayed voice turn, with its markdown preformatted"""
+    user_text: str
+    response_text: str
+    audio_data: Optional[bytes]
+    crisis_detected: bool
+    message_markdown: str
+    details_markdown: str
+
+@st.cache_resource
+def start_connection_warmup():
+    """Open the LLM and TTS connections and voice the crisis footer once per process, off the request path"""
+    return (
+        submit_coroutine(warm_up_ai_connections()),
+        submit_coroutine(warm_up_speech_connections()),
+        submit_coroutine(warm_up_crisis_audio())
+    )
 
 def initialize_session_state():
     """Initialize session state variables"""
+    if 'bot' not in st.session_state:
+        # Per-session state only; the AI and speech clients are process-wide singletons
+        st.session_state.bot = OmaniMentalHealthBot(session_id=_session_id_from_url())
     if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
+        restored = (
+            restore_history_entry(turn)
+            for turn in load_session_turns(st.session_state.bot.session_id, _HISTORY_DISPLAY_LIMIT)
+        )
+        st.session_state.conversation_history = deque(
+            (entry for entry in restored if entry is not None),
+            maxlen=_HISTORY_DISPLAY_LIMIT
+        )
     if 'current_session_id' not in st.session_state:
         st.session_state.current_session_id = None
     if 'processing' not in st.session_state:
         st.session_state.processing = False
+    
+    # Keep the session in the URL, so a reload, or a New Session, lands on the right conversation
+    if settings.session_store_dir and st.query_params.get("session") != st.session_state.bot.session_id:
+        st.query_params["session"] = st.session_state.bot.session_id
+
+def _session_id_from_url() -> Optional[str]:
+    """Session named in the page URL, continued only when session persistence is enabled"""
+    if not settings.session_store_dir:
+        return None
+    return parse_session_id(st.query_params.get("session"))
+
+def inject_custom_css():
+    """Inject the custom CSS; Streamlit drops elements not re-emitted, so this runs every rerun"""
+    st.html(_CUSTOM_CSS)
 
 def render_header():
     """Render the main header"""
-    st.markdown("""
-    <div class="main-header">
-        <h1>🧠 المساعد النفسي العماني</h1>
-        <h2>Omani Mental Health Assistant</h2>
-        <p>مساعد الصحة النفسية الذكي باللهجة العمانية الأصيلة</p>
-        <p>Voice-Only AI Mental Health Support in Authentic Omani Arabic</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
+@st.fragment
 def render_sidebar():
-    """Render sidebar with settings and stats"""
-    with st.sidebar:
-        st.markdown("### ⚙️ إعدادات | Settings")
-        
-        # System status
-        if st.button("🔍 Test System | اختبار النظام"):
-            with st.spinner("Testing system components..."):
-                test_results = test_bot_system()
-                
-                if test_results["overall_status"] == "healthy":
-                    st.success("✅ All systems operational")
-                elif test_results["overall_status"] == "partial":
-                    st.warning("⚠️ Some services unavailable")
-                else:
-                    st.error("❌ System issues detected")
-                
-                # Show detailed results
-                with st.expander("Detailed Results"):
-                    st.json(test_results)
-        
-        st.markdown("---")
-        
-        # Session management
-        st.markdown("### 📊 Session | الجلسة")
-        
-        if st.button("🔄 New Session | جلسة جديدة"):
-            reset_bot_session()
-            st.session_state.conversation_history = []
-            st.session_state.current_session_id = None
-            st.success("Session reset successfully")
-            st.rerun()
-        
-        # Show current stats
-        stats = get_bot_stats()
-        
-        st.markdown('<div class="stats-container">', unsafe_allow_html=True)
-        st.metric("Conversations", stats.get("conversation_count", 0))
-        
-        avg_time = stats.get("avg_response_time", 0)
-        target_met = "✅" if stats.get("performance_target_met", False) else "⚠️"
-        st.metric(
-            f"Avg Response Time {target_met}", 
-            f"{avg_time}s",
-            delta=f"Target: <{settings.max_response_time}s"
-        )
-        
-        crises = stats.get("total_crises_detected", 0)
-        if crises > 0:
-            st.metric("🚨 Crises Detected", crises)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        st.markdown("---")
-        
-        # Emergency contacts
-        st.markdown("### 🆘 Emergency | طوارئ")
-        st.markdown("""
-        **Oman Emergency Numbers:**
-        - 🚨 Police: **9999**
-        - 🏥 Mental Health: **24673000**
-        - 🩺 Ministry of Health: **24602077**
-        """)
+    """Render sidebar with settings and stats; a fragment, so its buttons rerun only the sidebar"""
+    st.markdown("### ⚙️ إعدادات | Settings")
+    
+    # System status
+    if st.button("🔍 Test System | اختبار النظام"):
+        with st.spinner("Testing system components..."):
+            test_results = st.session_state.bot.test_system()
+            
+            if test_results["overall_status"] == "healthy":
+                st.success("✅ All systems operational")
+            elif test_results["overall_status"] == "partial":
+                st.warning("⚠️ Some services unavailable")
+            else:
+                st.error("❌ System issues detected")
+            
+            # Show detailed results
+            with st.expander("Detailed Results"):
+                st.json(test_results)
+    
+    st.markdown("---")
+    
+    # Session management
+    st.markdown("### 📊 Session | الجلسة")
+    
+    if st.button("🔄 New Session | جلسة جديدة"):
+        forget_session(st.session_state.bot.session_id)
+        st.session_state.bot.reset_session()
+        st.session_state.conversation_history = deque(maxlen=_HISTORY_DISPLAY_LIMIT)
+        st.session_state.current_session_id = None
+        st.success("Session reset successfully")
+        st.rerun()
+    
+    # Show current stats
+    stats = st.session_state.bot.get_session_stats()
+    
+    st.markdown('<div class="stats-container">', unsafe_allow_html=True)
+    st.metric("Conversations", stats.get("conversation_count", 0))
+    
+    avg_time = stats.get("avg_response_time", 0)
+    target_met = "✅" if stats.get("performance_target_met", False) else "⚠️"
+    st.metric(
+        f"Avg Response Time {target_met}", 
+        f"{avg_time}s",
+        delta=f"Target: <{settings.max_response_time}s"
+    )
+    
+    crises = stats.get("total_crises_detected", 0)
+    if crises > 0:
+        st.metric("🚨 Crises Detected", crises)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    st.markdown("---")
+    
+    # Emergency contacts
+    st.markdown("### 🆘 Emergency | طوارئ")
+    st.markdown(_EMERGENCY_NUMBERS_MD)
 
 def render_voice_interface():
     """Render the main voice recording interface"""
@@ -200,7 +291,8 @@ def render_voice_interface():
     audio = mic_recorder(
         start_prompt="🎤 ابدأ التحدث | Start Speaking",
         stop_prompt="⏹️ أوقف التسجيل | Stop Recording",
-        just_once=False,
+        # Each recording is returned once, so the app rerun after a turn does not process it again
+        just_once=True,
         use_container_width=True,
         callback=None,
         args=(),
@@ -218,135 +310,174 @@ def render_voice_interface():
         if audio_bytes and len(audio_bytes) > 1000:  # Minimum audio size
             st.session_state.processing = True
             process_voice_message(audio_bytes)
+    
+    # Outcome of the turn that just finished, carried across the app rerun that refreshed the sidebar
+    turn_status_html = st.session_state.pop("turn_status_html", None)
+    if turn_status_html and audio is None:
+        st.markdown(turn_status_html, unsafe_allow_html=True)
 
 def process_voice_message(audio_bytes: bytes):
     """Process voice message through the mental health bot"""
+    # The transcript shows as soon as STT finishes, while the reply is still being generated
+    transcript = st.empty()
+    # One slot for the whole turn's status: the spinner, then the outcome, replace each other in place
+    status = st.empty()
     
+    def show_transcript(user_text: str):
+        transcript.markdown(f"**🧑‍💼 You | أنت:**\n\n> {user_text}")
+    
+    rerun_app = False
     try:
-        with st.spinner("🎤 معالجة الصوت... | Processing voice..."):
-            # Use asyncio to run the async function
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                result = loop.run_until_complete(process_user_voice(audio_bytes))
-            finally:
-                loop.close()
+        with status, st.spinner("🎤 معالجة الصوت... | Processing voice..."):
+            # Run on the shared background loop so async client pools survive between messages;
+            # Streamlit elements can only be updated from this thread, so the transcript is queued back
+            transcripts: "queue.Queue[str]" = queue.Queue()
+            result = run_coroutine_with_updates(
+                st.session_state.bot.process_voice_input(audio_bytes, on_transcript=transcripts.put),
+                transcripts,
+                show_transcript,
+                timeout=settings.voice_turn_timeout
+            )
         
         if result["success"]:
-            # Add to conversation history
-            conversation_entry = {
-                "timestamp": datetime.now(),
-                "user_text": result["user_text"],
-                "response_text": result["response_text"],
-                "audio_data": result["audio_data"],
-                "crisis_detected": result.get("crisis_detected", False),
-                "processing_time": result["processing_time"]
-            }
+            # The history entry below repeats the transcript
+            transcript.empty()
+            # Add to conversation history, and persist it off this thread when enabled
+            entry = build_history_entry(result)
+            st.session_state.conversation_history.append(entry)
+            save_session_turn(st.session_state.bot.session_id, {
+                "user_text": entry.user_text,
+                "response_text": entry.response_text,
+                "crisis_detected": entry.crisis_detected,
+                "details_markdown": entry.details_markdown
+            })
             
-            st.session_state.conversation_history.append(conversation_entry)
-            
-            # Show success
-            st.markdown(f"""
-            <div class="success-message">
-                ✅ <strong>Response processed in {result['processing_time']:.2f}s</strong>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Show crisis alert if detected
+            # Show success, plus the crisis alert if detected, once the app has rerun
+            status_html = _SUCCESS_STATUS_TEMPLATE.format(processing_time=result["processing_time"])
             if result.get("crisis_detected", False):
-                st.markdown("""
-                <div class="crisis-alert">
-                    🚨 <strong>Crisis Support Activated</strong><br>
-                    Emergency resources have been included in the response.
-                </div>
-                """, unsafe_allow_html=True)
+                status_html += _CRISIS_ALERT_HTML
+            st.session_state.turn_status_html = status_html
+            # The sidebar stats (turn count, crises detected) sit outside this fragment
+            rerun_app = True
         
         else:
-            st.error(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
+            status.error(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
             
+    except FutureTimeoutError:
+        status.error(f"❌ Processing timed out after {settings.voice_turn_timeout:.0f}s - please try again")
+        logger.error("Voice processing timed out")
+    
     except Exception as e:
-        st.error(f"❌ System error: {str(e)}")
-        logger.error(f"Voice processing error: {e}")
+        status.error(f"❌ System error: {str(e)}")
+        logger.error("Voice processing error: %s", e)
     
     finally:
         st.session_state.processing = False
+    
+    if rerun_app:
+        st.rerun(scope="app")
+
+def build_history_entry(result: Dict[str, Any]) -> HistoryEntry:
+    """Format a turn's markdown once when it is recorded; entries never change, so reruns reuse it"""
+    crisis_detected = result.get("crisis_detected", False)
+    
+    details_parts = [f"**Time:** {result['processing_time']:.2f}s"]
+    if crisis_detected:
+        details_parts.append("🚨 **Crisis Detected**")
+    details_parts.append(f"**🕐** {datetime.now().strftime('%H:%M:%S')}")
+    
+    return HistoryEntry(
+        user_text=result["user_text"],
+        response_text=result["response_text"],
+        audio_data=result["audio_data"],
+        crisis_detected=crisis_detected,
+        message_markdown=_format_message(result["user_text"], result["response_text"], bool(result["audio_data"])),
+        details_markdown="\n\n".join(details_parts)
+    )
+
+def restore_history_entry(turn: Any) -> Optional[HistoryEntry]:
+    """Rebuild a persisted turn as text only (audio is not stored), or None when it lacks its texts"""
+    user_text = turn.get("user_text") if isinstance(turn, dict) else None
+    response_text = turn.get("response_text") if isinstance(turn, dict) else None
+    if not isinstance(user_text, str) or not isinstance(response_text, str):
+        # A hand-edited or older-format line; skip it so the rest of the session still opens
+        logger.warning("Skipping persisted turn without user and response text")
+        return None
+    
+    return HistoryEntry(
+        user_text=user_text,
+        response_text=response_text,
+        audio_data=None,
+        crisis_detected=bool(turn.get("crisis_detected", False)),
+        message_markdown=_format_message(user_text, response_text, False),
+        details_markdown=str(turn.get("details_markdown", ""))
+    )
+
+def _format_message(user_text: str, response_text: str, has_audio: bool) -> str:
+    """User message and AI response, sent as one markdown element per entry"""
+    message_parts = [
+        "**🧑‍💼 You | أنت:**",
+        f"> {user_text}",
+        "**🤖 Assistant | المساعد:**",
+        f"> {response_text}"
+    ]
+    if has_audio:
+        message_parts.append("**🔊 Audio Response | الرد الصوتي:**")
+    return "\n\n".join(message_parts)
 
 def render_conversation_history():
     """Render conversation history"""
     if not st.session_state.conversation_history:
-        st.info("""
-        ### 🌟 Welcome | أهلاً وسهلاً
-        
-        **Voice-Only Mental Health Support in Omani Arabic**
-        **دعم الصحة النفسية بالصوت فقط باللهجة العمانية**
-        
-        Click the microphone above and start speaking in Omani Arabic.
-        اضغط على الميكروفون أعلاه وابدأ بالتحدث بالعربية العمانية.
-        
-        I'm here to listen and provide culturally sensitive mental health support.
-        أنا هنا لأستمع إليك وأقدم لك الدعم النفسي المناسب ثقافياً.
-        """)
+        st.info(_WELCOME_MESSAGE)
         return
     
     st.markdown("### 💬 المحادثة | Conversation")
     
-    for i, entry in enumerate(reversed(st.session_state.conversation_history[-5:])):  # Show last 5
-        with st.container():
+    for entry in reversed(st.session_state.conversation_history):
+        # A bordered container separates entries without a separate divider element per entry
+        with st.container(border=True):
             col1, col2 = st.columns([3, 1])
             
             with col1:
-                # User message
-                st.markdown(f"**🧑‍💼 You | أنت:**")
-                st.markdown(f"> {entry['user_text']}")
-                
-                # AI response
-                st.markdown(f"**🤖 Assistant | المساعد:**")
-                st.markdown(f"> {entry['response_text']}")
+                st.markdown(entry.message_markdown)
                 
                 # Audio player
-                if entry.get("audio_data"):
-                    st.markdown("**🔊 Audio Response | الرد الصوتي:**")
-                    audio_bytes = entry["audio_data"]
-                    st.audio(audio_bytes, format="audio/wav")
+                if entry.audio_data:
+                    st.audio(entry.audio_data, format="audio/wav")
             
             with col2:
-                st.markdown(f"**Time:** {entry['processing_time']:.2f}s")
-                
-                if entry.get("crisis_detected", False):
-                    st.markdown("🚨 **Crisis Detected**")
-                
-                timestamp = entry["timestamp"].strftime("%H:%M:%S")
-                st.markdown(f"**🕐** {timestamp}")
-            
-            st.markdown("---")
+                st.markdown(entry.details_markdown)
+
+@st.fragment
+def render_conversation_panel():
+    """Render the recorder and the history as one fragment; a finished turn then reruns the app so the sidebar stats refresh"""
+    render_voice_interface()
+    render_conversation_history()
 
 def main():
     """Main application"""
     try:
+        start_connection_warmup()
         initialize_session_state()
         
         # Render components
+        inject_custom_css()
         render_header()
-        render_sidebar()
-        render_voice_interface()
-        render_conversation_history()
+        # Fragments cannot open the sidebar themselves, so enter it here
+        with st.sidebar:
+            render_sidebar()
+        render_conversation_panel()
         
         # Footer
         st.markdown("---")
-        st.markdown("""
-        <div style="text-align: center; padding: 1rem; color: #666;">
-            <p>🔒 Your privacy is protected | خصوصيتك محمية</p>
-            <p>For emergencies, call 9999 | في حالة الطوارئ، اتصل بـ 9999</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
         
     except Exception as e:
         st.error(f"Application error: {str(e)}")
-        logger.error(f"Main app error: {e}")
+        logger.error("Main app error: %s", e)
         
-        if st.button("🔄 Restart Application"):
-            st.rerun()
+        # The click itself reruns the script; an explicit st.rerun() would run it twice
+        st.button("🔄 Restart Application")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Voice-Only Omani Arabic Mental Health Chatbot
+Background Event Loop: one long-lived asyncio loop shared by all Streamlit sessions
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Coroutine, Optional
+
+# The async OpenAI/Anthropic clients keep connection pools bound to the loop that
+# opened them, so every coroutine must run on the same loop for the process lifetime
+_loop = asyncio.new_event_loop()
+# Blocking SDK calls (Whisper, Azure TTS) run via asyncio.to_thread; the default pool caps at
+# min(32, cpu + 4) workers, which a few concurrent voice turns can exhaust on small instances
+_loop.set_default_executor(ThreadPoolExecutor(max_workers=64, thread_name_prefix="background-io"))
+_thread = threading.Thread(target=_loop.run_forever, name="background-event-loop", daemon=True)
+_thread.start()
+
+# How often a waiting caller checks for progress updates
+_UPDATE_POLL_INTERVAL = 0.05
+
+def run_coroutine(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the background loop and block until it completes
+
+    Args:
+        coro: Coroutine to schedule
+        timeout: Optional seconds to wait for the result
+
+    Returns:
+        The coroutine's result
+        
+    Raises:
+        concurrent.futures.TimeoutError: If the timeout elapses; the coroutine is cancelled
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # Cancel the abandoned coroutine so it stops holding connections and worker threads
+        future.cancel()
+        raise
+
+def run_coroutine_with_updates(
+    coro: Coroutine[Any, Any, Any],
+    updates: "queue.Queue[Any]",
+    on_update: Callable[[Any], None],
+    timeout: Optional[float] = None
+) -> Any:
+    """
+    Run a coroutine on the background loop, handing each item it puts on `updates`
+    to `on_update` on the calling thread while waiting for the result
+    
+    Args:
+        coro: Coroutine to schedule
+        updates: Queue the coroutine reports progress on
+        on_update: Called with each update, on the calling thread
+        timeout: Optional seconds to wait for the result
+        
+    Returns:
+        The coroutine's result
+        
+    Raises:
+        concurrent.futures.TimeoutError: If the timeout elapses; the coroutine is cancelled
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    
+    while not future.done():
+        if deadline is not None and time.monotonic() >= deadline:
+            future.cancel()
+            raise FutureTimeoutError()
+        try:
+            on_update(updates.get(timeout=_UPDATE_POLL_INTERVAL))
+        except queue.Empty:
+            pass
+    
+    # Deliver anything reported just before completion
+    while True:
+        try:
+            on_update(updates.get_nowait())
+        except queue.Empty:
+            break
+    
+    return future.result()
+
+def submit_coroutine(coro: Coroutine[Any, Any, Any]) -> Future:
+    """
+    Schedule a coroutine on the background loop without waiting for it
+    
+    Args:
+        coro: Coroutine to schedule
+        
+    Returns:
+        Future that resolves with the coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
@@ -24,6 +24,19 @@ class Settings(BaseSettings):
     max_response_time: int = Field(default=15, env="MAX_RESPONSE_TIME")
     enable_crisis_detection: bool = Field(default=True, env="ENABLE_CRISIS_DETECTION")
     enable_logging: bool = Field(default=True, env="ENABLE_LOGGING")
+    openai_max_concurrent: int = Field(default=16, env="OPENAI_MAX_CONCURRENT")
+    response_cache_size: int = Field(default=512, env="RESPONSE_CACHE_SIZE")
+    redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
+    history_max_chars: int = Field(default=6000, env="HISTORY_MAX_CHARS")
+    conversation_ttl: int = Field(default=86400, env="CONVERSATION_TTL")
+    llm_hedge_delay: float = Field(default=2.5, env="LLM_HEDGE_DELAY")
+    llm_keepalive_interval: int = Field(default=60, env="LLM_KEEPALIVE_INTERVAL")
+    speech_timeout: float = Field(default=15.0, env="SPEECH_TIMEOUT")
+    voice_turn_timeout: float = Field(default=60.0, env="VOICE_TURN_TIMEOUT")
+    enable_local_quality_gate: bool = Field(default=True, env="ENABLE_LOCAL_QUALITY_GATE")
+    tts_cache_size: int = Field(default=32, env="TTS_CACHE_SIZE")
+    tts_max_parallel: int = Field(default=3, env="TTS_MAX_PARALLEL")
+    session_store_dir: Optional[str] = Field(default=None, env="SESSION_STORE_DIR")
     
     # Language & Cultural Settings
     primary_language: str = Field(default="ar-OM", env="PRIMARY_LANGUAGE")
@@ -67,6 +80,11 @@ CRISIS_KEYWORDS_MIXED = [
     "want to die والله", "depression شديد", "feeling hopeless يا رب"
 ]
 
+# Every crisis keyword, lowercased and de-duplicated, for matchers built at import time
+CRISIS_KEYWORDS_ALL = frozenset(
+    keyword.lower() for keyword in CRISIS_KEYWORDS_AR + CRISIS_KEYWORDS_EN + CRISIS_KEYWORDS_MIXED
+)
+
 # Omani Arabic cultural context
 OMANI_CULTURAL_PHRASES = {
     "greeting": "السلام عليكم، أهلاً وسهلاً بك",
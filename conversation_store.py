@@ -0,0 +1,155 @@
+"""
+Voice-Only Omani Arabic Mental Health Chatbot
+Conversation Store: per-conversation message history, in-process or shared via Redis
+
+History is truncated lazily: once a conversation exceeds `max_messages` or `max_chars`
+it drops back to the most recent half of both budgets. Between truncations the window
+only grows, so the prompt prefix sent to the LLMs stays byte-identical and provider
+prompt caching can hit. Conversations idle for longer than `ttl` seconds are forgotten.
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from background_loop import run_coroutine
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# How long startup waits for Redis before falling back to in-process history
+_REDIS_CONNECT_TIMEOUT = 5.0
+
+def _trim_start(lengths: List[int], max_messages: int, max_chars: int) -> int:
+    """Index of the first message to keep once a window has overflowed its budgets"""
+    # Messages arrive as user/assistant pairs; dropping whole pairs keeps the window opening on a user turn
+    start, chars = 0, sum(lengths)
+    while start < len(lengths) and (len(lengths) - start > max_messages // 2 or chars > max_chars // 2):
+        chars -= sum(lengths[start:start + 2])
+        start += 2
+    return min(start, len(lengths))
+
+class InMemoryConversationStore:
+    """Keeps each conversation's recent messages in this process"""
+
+    def __init__(self, max_messages: int = 20, max_chars: int = 6000, ttl: int = 86400):
+        """Initialize the store"""
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.ttl = ttl
+        # Ordered least recently active first, so expired conversations are swept from the front
+        self._histories: "OrderedDict[str, Deque[Dict[str, str]]]" = OrderedDict()
+        self._history_chars: Dict[str, int] = {}
+        self._last_active: Dict[str, float] = {}
+
+    async def get_messages(self, conversation_id: str) -> List[Dict[str, str]]:
+        """Return the conversation's current window, oldest first"""
+        self._expire_idle(time.monotonic())
+        return list(self._histories.get(conversation_id, ()))
+
+    async def append(self, conversation_id: str, *messages: Dict[str, str]):
+        """Append messages, dropping back to the newest half once past either budget"""
+        now = time.monotonic()
+        self._expire_idle(now)
+        history = self._histories.get(conversation_id)
+        if history is None:
+            history = self._histories[conversation_id] = deque()
+        else:
+            self._histories.move_to_end(conversation_id)
+        self._last_active[conversation_id] = now
+        history.extend(messages)
+        chars = self._history_chars.get(conversation_id, 0) + sum(len(message["content"]) for message in messages)
+
+        if len(history) > self.max_messages or chars > self.max_chars:
+            lengths = [len(message["content"]) for message in history]
+            for _ in range(_trim_start(lengths, self.max_messages, self.max_chars)):
+                chars -= len(history.popleft()["content"])
+
+        self._history_chars[conversation_id] = chars
+
+    async def clear(self, conversation_id: str):
+        """Forget a conversation"""
+        self._histories.pop(conversation_id, None)
+        self._history_chars.pop(conversation_id, None)
+        self._last_active.pop(conversation_id, None)
+
+    def _expire_idle(self, now: float):
+        """Drop conversations that have been idle for longer than the TTL"""
+        while self._histories:
+            conversation_id = next(iter(self._histories))
+            if now - self._last_active[conversation_id] <= self.ttl:
+                break
+            del self._histories[conversation_id]
+            del self._history_chars[conversation_id]
+            del self._last_active[conversation_id]
+
+class RedisConversationStore:
+    """Keeps each conversation's recent messages in Redis so any worker can serve the next turn"""
+
+    def __init__(self, redis_url: str, max_messages: int = 20, max_chars: int = 6000, ttl: int = 86400):
+        """Initialize the store"""
+        import redis.asyncio as redis
+
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}"
+
+    @staticmethod
+    def _chars_key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:chars"
+
+    async def ping(self):
+        """Check that Redis is reachable; from_url alone does not connect"""
+        await self._redis.ping()
+
+    async def get_messages(self, conversation_id: str) -> List[Dict[str, str]]:
+        """Return the conversation's current window, oldest first"""
+        raw_messages = await self._redis.lrange(self._key(conversation_id), 0, -1)
+        return [json.loads(raw) for raw in raw_messages]
+
+    async def append(self, conversation_id: str, *messages: Dict[str, str]):
+        """Append messages, dropping back to the newest half once past either budget"""
+        key = self._key(conversation_id)
+        chars_key = self._chars_key(conversation_id)
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(json.dumps(message, ensure_ascii=False) for message in messages))
+            pipe.incrby(chars_key, sum(len(message["content"]) for message in messages))
+            pipe.expire(key, self.ttl)
+            pipe.expire(chars_key, self.ttl)
+            length, chars, _, _ = await pipe.execute()
+
+        if length > self.max_messages or chars > self.max_chars:
+            lengths = [len(json.loads(raw)["content"]) for raw in await self._redis.lrange(key, 0, -1)]
+            start = _trim_start(lengths, self.max_messages, self.max_chars)
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.ltrim(key, start, -1)
+                pipe.set(chars_key, sum(lengths[start:]), ex=self.ttl)
+                await pipe.execute()
+
+    async def clear(self, conversation_id: str):
+        """Forget a conversation"""
+        await self._redis.delete(self._key(conversation_id), self._chars_key(conversation_id))
+
+def create_conversation_store(redis_url: Optional[str] = None):
+    """Use Redis when a URL is configured, otherwise keep history in process"""
+    redis_url = redis_url or settings.redis_url
+    max_chars = settings.history_max_chars
+    ttl = settings.conversation_ttl
+    if redis_url:
+        try:
+            store = RedisConversationStore(redis_url, max_chars=max_chars, ttl=ttl)
+            # Connect on the loop that will own the connection pool, so an unreachable server falls back here
+            run_coroutine(store.ping(), timeout=_REDIS_CONNECT_TIMEOUT)
+            logger.info("Conversation history stored in Redis")
+            return store
+        except Exception as e:
+            logger.warning("Redis conversation store unavailable - using in-process history: %r", e)
+    return InMemoryConversationStore(max_chars=max_chars, ttl=ttl)
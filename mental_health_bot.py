@@ -6,42 +6,56 @@ Main Mental Health Bot - Therapeutic Logic & Coordination
 import logging
 import asyncio
 import time
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Tuple
 from datetime import datetime
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-from speech_service import transcribe_audio, synthesize_speech, test_speech_services
-from ai_service import get_ai_response, clear_conversation_history
+from speech_service import transcribe_audio, synthesize_speech, pin_speech, join_speech_audio, test_speech_services
+from ai_service import ai_service, get_ai_response, clear_conversation_history
+from background_loop import run_coroutine
 from config import settings, EMERGENCY_CONTACTS, ISLAMIC_CBT_TECHNIQUES
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the app entrypoint
 logger = logging.getLogger(__name__)
 
+# Emergency contacts are fixed at import, so the crisis footer is built once
+_CRISIS_SUPPORT_TEXT = f"""
+        
+        🚨 في حالة الطوارئ:
+        - اتصل بالطوارئ: {EMERGENCY_CONTACTS['police']}
+        - الخط الساخن للصحة النفسية: {EMERGENCY_CONTACTS['mental_health_hotline']}
+        - وزارة الصحة: {EMERGENCY_CONTACTS['ministry_of_health']}
+        
+        أنت لست وحدك، والمساعدة متوفرة دائماً.
+        """
+
 class OmaniMentalHealthBot:
     """Main mental health chatbot with voice-only interface"""
     
-    def __init__(self):
-        """Initialize the mental health bot"""
-        self.session_id = str(uuid.uuid4())
+    def __init__(self, session_id: Optional[str] = None):
+        """Initialize the mental health bot, continuing `session_id` when given"""
+        self.session_id = session_id or str(uuid.uuid4())
         self.session_start_time = datetime.now()
         self.conversation_count = 0
         self.crisis_alerts = []
-        self.response_times = []
+        # Running mean over conversation_count turns, so stats neither rescan nor keep every sample
+        self.avg_response_time = 0.0
         
-        logger.info(f"Omani Mental Health Bot initialized - Session: {self.session_id}")
+        logger.info("Omani Mental Health Bot initialized - Session: %s", self.session_id)
     
-    async def process_voice_input(self, audio_data: bytes) -> Dict[str, Any]:
+    async def process_voice_input(self, audio_data: bytes, on_transcript: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         Main processing pipeline: Audio → STT → AI → TTS → Audio
         
         Args:
             audio_data: Raw audio bytes from user
+            on_transcript: Optional callback given the transcript as soon as STT finishes
             
         Returns:
             Dict with response audio and metadata
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             # Step 1: Speech-to-Text
@@ -74,7 +88,9 @@ class OmaniMentalHealthBot:
                     "audio_info": stt_result
                 }
             
-            logger.info(f"✅ STT Success: '{user_text[:50]}...'")
+            logger.info("✅ STT Success: '%s...'", user_text[:50])
+            if on_transcript:
+                on_transcript(user_text)
             
             # Step 2: AI Processing
             logger.info("🤖 Processing AI response...")
@@ -91,17 +107,19 @@ class OmaniMentalHealthBot:
             response_text = ai_result["response"]
             crisis_detected = ai_result.get("crisis_detected", False)
             
-            logger.info(f"✅ AI Response: '{response_text[:50]}...'")
+            logger.info("✅ AI Response: '%s...'", response_text[:50])
+            
+            # Step 3: Text-to-Speech
+            logger.info("🔊 Processing text-to-speech...")
             
             # Handle crisis detection
             if crisis_detected:
                 self._handle_crisis_detection(user_text, response_text)
+                tts_result = await self._synthesize_crisis_response(response_text)
                 # Enhance response with crisis support
                 response_text = self._enhance_crisis_response(response_text)
-            
-            # Step 3: Text-to-Speech
-            logger.info("🔊 Processing text-to-speech...")
-            tts_result = await synthesize_speech(response_text, settings.tts_voice_female)
+            else:
+                tts_result = await synthesize_speech(response_text, settings.tts_voice_female)
             
             if not tts_result["success"]:
                 return {
@@ -113,11 +131,11 @@ class OmaniMentalHealthBot:
                 }
             
             # Calculate total processing time
-            total_time = time.time() - start_time
-            self.response_times.append(total_time)
+            total_time = time.perf_counter() - start_time
             self.conversation_count += 1
+            self.avg_response_time += (total_time - self.avg_response_time) / self.conversation_count
             
-            logger.info(f"✅ TTS Success - Total processing time: {total_time:.2f}s")
+            logger.info("✅ TTS Success - Total processing time: %.2fs", total_time)
             
             return {
                 "success": True,
@@ -139,12 +157,12 @@ class OmaniMentalHealthBot:
             }
             
         except Exception as e:
-            logger.error(f"Voice processing error: {e}")
+            logger.error("Voice processing error: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "stage": "general",
-                "processing_time": time.time() - start_time
+                "processing_time": time.perf_counter() - start_time
             }
     
     def _handle_crisis_detection(self, user_text: str, response_text: str):
@@ -157,7 +175,7 @@ class OmaniMentalHealthBot:
         }
         
         self.crisis_alerts.append(crisis_event)
-        logger.warning(f"🚨 CRISIS DETECTED - Session: {self.session_id}")
+        logger.warning("🚨 CRISIS DETECTED - Session: %s", self.session_id)
         
         # In production, this would trigger alerts to supervisors
         if settings.enable_logging:
@@ -165,21 +183,29 @@ class OmaniMentalHealthBot:
     
     def _enhance_crisis_response(self, response_text: str) -> str:
         """Enhance response with crisis support information"""
-        crisis_support = f"""
-        
-        🚨 في حالة الطوارئ:
-        - اتصل بالطوارئ: {EMERGENCY_CONTACTS['police']}
-        - الخط الساخن للصحة النفسية: {EMERGENCY_CONTACTS['mental_health_hotline']}
-        - وزارة الصحة: {EMERGENCY_CONTACTS['ministry_of_health']}
+        return response_text + _CRISIS_SUPPORT_TEXT
+    
+    async def _synthesize_crisis_response(self, response_text: str) -> Dict[str, Any]:
+        """Voice the reply and the fixed crisis footer separately; the footer's audio is pinned at startup"""
+        reply_result, support_result = await asyncio.gather(
+            synthesize_speech(response_text, settings.tts_voice_female),
+            synthesize_speech(_CRISIS_SUPPORT_TEXT, settings.tts_voice_female)
+        )
         
-        أنت لست وحدك، والمساعدة متوفرة دائماً.
-        """
+        for result in (reply_result, support_result):
+            if not result["success"]:
+                return result
         
-        return response_text + crisis_support
+        return {
+            **reply_result,
+            "audio_data": await join_speech_audio([reply_result["audio_data"], support_result["audio_data"]]),
+            "processing_time": max(reply_result["processing_time"], support_result["processing_time"]),
+            "text_length": reply_result["text_length"] + support_result["text_length"]
+        }
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Get current session statistics"""
-        avg_response_time = sum(self.response_times) / len(self.response_times) if self.response_times else 0
+        avg_response_time = self.avg_response_time
         
         return {
             "session_id": self.session_id,
@@ -195,9 +221,21 @@ class OmaniMentalHealthBot:
         """Test all system components"""
         logger.info("🔍 Testing system components...")
         
+        # Probe through the shared async clients on the loop that owns their pool
+        try:
+            speech_results, ai_results = run_coroutine(self._probe_all_services(), timeout=settings.voice_turn_timeout)
+        except FutureTimeoutError:
+            logger.error("System test timed out after %.0fs", settings.voice_turn_timeout)
+            return {
+                "speech_services": {},
+                "ai_services": {},
+                "overall_status": "error",
+                "error": f"System test timed out after {settings.voice_turn_timeout:.0f}s"
+            }
+        
         results = {
-            "speech_services": test_speech_services(),
-            "ai_services": self._test_ai_services(),
+            "speech_services": speech_results,
+            "ai_services": ai_results,
             "overall_status": "unknown"
         }
         
@@ -212,66 +250,82 @@ class OmaniMentalHealthBot:
         else:
             results["overall_status"] = "error"
         
-        logger.info(f"✅ System test completed - Status: {results['overall_status']}")
+        logger.info("✅ System test completed - Status: %s", results["overall_status"])
         return results
     
-    def _test_ai_services(self) -> Dict[str, Any]:
-        """Test AI service availability"""
-        results = {
-            "openai_available": False,
-            "anthropic_available": False
-        }
+    async def _probe_all_services(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Probe speech and the LLM providers concurrently, so the test takes the slowest probe, not their sum"""
+        return await asyncio.gather(
+            # The speech test blocks on an Azure synthesis round-trip
+            asyncio.to_thread(test_speech_services),
+            self._probe_ai_services()
+        )
+    
+    async def _probe_ai_services(self) -> Dict[str, Any]:
+        """Probe both LLM providers concurrently"""
+        openai_available, anthropic_available = await asyncio.gather(
+            self._probe_openai(),
+            self._probe_anthropic()
+        )
         
+        return {
+            "openai_available": openai_available,
+            "anthropic_available": anthropic_available
+        }
+    
+    async def _probe_openai(self) -> bool:
+        """Test OpenAI availability"""
         try:
-            # Test OpenAI
-            if settings.openai_api_key:
-                from openai import OpenAI
-                client = OpenAI(api_key=settings.openai_api_key)
-                test_response = client.chat.completions.create(
+            if ai_service.openai_client:
+                await ai_service.openai_client.chat.completions.create(
                     model="gpt-4o",
                     messages=[{"role": "user", "content": "Test"}],
                     max_tokens=5
                 )
-                results["openai_available"] = True
                 logger.info("✅ OpenAI GPT-4o available")
-            else:
-                logger.warning("⚠️ OpenAI API key not configured")
+                return True
+            logger.warning("⚠️ OpenAI API key not configured")
             
         except Exception as e:
-            logger.warning(f"⚠️ OpenAI test failed: {e}")
+            logger.warning("⚠️ OpenAI test failed: %s", e)
         
+        return False
+    
+    async def _probe_anthropic(self) -> bool:
+        """Test Anthropic availability"""
         try:
-            # Test Anthropic
-            if settings.anthropic_api_key:
-                from anthropic import Anthropic
-                client = Anthropic(api_key=settings.anthropic_api_key)
-                test_response = client.messages.create(
+            if ai_service.anthropic_client:
+                await ai_service.anthropic_client.messages.create(
                     model="claude-sonnet-4-20250514",
                     max_tokens=5,
                     messages=[{"role": "user", "content": "Test"}]
                 )
-                results["anthropic_available"] = True
                 logger.info("✅ Anthropic Claude available")
-            else:
-                logger.warning("⚠️ Anthropic API key not configured")
+                return True
+            logger.warning("⚠️ Anthropic API key not configured")
             
         except Exception as e:
-            logger.warning(f"⚠️ Anthropic test failed: {e}")
+            logger.warning("⚠️ Anthropic test failed: %s", e)
         
-        return results
+        return False
     
     def reset_session(self):
         """Reset session for new conversation"""
+        previous_session_id = self.session_id
         self.session_id = str(uuid.uuid4())
         self.session_start_time = datetime.now()
         self.conversation_count = 0
         self.crisis_alerts = []
-        self.response_times = []
+        self.avg_response_time = 0.0
         
-        # Clear AI conversation history
-        clear_conversation_history()
+        # Clear AI conversation history on the loop that owns the store's connections
+        try:
+            run_coroutine(clear_conversation_history(previous_session_id), timeout=settings.voice_turn_timeout)
+        except FutureTimeoutError:
+            # The new session does not share the old history; the store's TTL forgets it
+            logger.warning("Clearing history for session %s timed out", previous_session_id)
         
-        logger.info(f"🔄 Session reset - New session: {self.session_id}")
+        logger.info("🔄 Session reset - New session: %s", self.session_id)
     
     def get_therapeutic_resources(self) -> Dict[str, Any]:
         """Get Islamic CBT resources and techniques"""
@@ -283,22 +337,7 @@ class OmaniMentalHealthBot:
             "therapeutic_model": "CBT + Islamic principles"
         }
 
-# Global bot instance
-omani_bot = OmaniMentalHealthBot()
-
 # Convenience functions
-async def process_user_voice(audio_data: bytes) -> Dict[str, Any]:
-    """Convenience function for processing voice input"""
-    return await omani_bot.process_voice_input(audio_data)
-
-def get_bot_stats() -> Dict[str, Any]:
-    """Convenience function for getting session stats"""
-    return omani_bot.get_session_stats()
-
-def test_bot_system() -> Dict[str, Any]:
-    """Convenience function for testing system"""
-    return omani_bot.test_system()
-
-def reset_bot_session():
-    """Convenience function for resetting session"""
-    omani_bot.reset_session() 
\ No newline at end of file
+async def warm_up_crisis_audio():
+    """Convenience function to pre-synthesize the crisis footer so crisis replies never wait on it"""
+    await pin_speech(_CRISIS_SUPPORT_TEXT, settings.tts_voice_female)
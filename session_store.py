@@ -0,0 +1,109 @@
+"""
+Voice-Only Omani Arabic Mental Health Chatbot
+Session Store: displayed conversation turns kept on disk, so reloading the page restores them
+
+Each session's turns are appended to <directory>/<session_id>.jsonl by a single writer thread,
+so a voice turn never waits on disk I/O. Audio is not persisted; restored turns show text only.
+Persistence is off unless SESSION_STORE_DIR is set.
+"""
+
+import json
+import logging
+import queue
+import threading
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def parse_session_id(value: Optional[str]) -> Optional[str]:
+    """Normalize a session id taken from the page URL, or None when it is not a UUID"""
+    try:
+        return str(uuid.UUID(value or ""))
+    except ValueError:
+        return None
+
+class SessionStore:
+    """Appends each session's turns to a JSONL file and reads the newest ones back"""
+
+    def __init__(self, directory: str):
+        """Initialize the store and start its writer thread"""
+        self.directory = Path(directory)
+        # (session_id, line) to append, or (session_id, None) to delete the session's file
+        self._writes: "queue.SimpleQueue[Tuple[str, Optional[str]]]" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_forever, name="session-store-writer", daemon=True)
+        self._writer.start()
+
+    def _path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.jsonl"
+
+    def load(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Return the session's newest `limit` turns, oldest first"""
+        session_id = parse_session_id(session_id)
+        if session_id is None:
+            return []
+        try:
+            with self._path(session_id).open(encoding="utf-8") as session_file:
+                lines = deque(session_file, maxlen=limit)
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logger.warning("Could not restore session %s: %s", session_id, e)
+            return []
+
+        turns = []
+        for line in lines:
+            try:
+                turns.append(json.loads(line))
+            except ValueError:
+                # A line torn by a crash mid-write; the turns around it are still usable
+                logger.warning("Skipping unreadable turn in session %s", session_id)
+        return turns
+
+    def append(self, session_id: str, turn: Dict[str, Any]):
+        """Queue a turn to be appended to the session's file"""
+        session_id = parse_session_id(session_id)
+        if session_id is not None:
+            self._writes.put((session_id, json.dumps(turn, ensure_ascii=False)))
+
+    def forget(self, session_id: str):
+        """Queue the session's file for deletion, after any turns still waiting to be written"""
+        session_id = parse_session_id(session_id)
+        if session_id is not None:
+            self._writes.put((session_id, None))
+
+    def _write_forever(self):
+        """Writer thread: apply queued appends and deletions in order"""
+        while True:
+            session_id, line = self._writes.get()
+            try:
+                if line is None:
+                    self._path(session_id).unlink(missing_ok=True)
+                    continue
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with self._path(session_id).open("a", encoding="utf-8") as session_file:
+                    session_file.write(line + "\n")
+            except OSError as e:
+                logger.warning("Could not update session %s file: %s", session_id, e)
+
+# Global session store, only when persistence is configured
+session_store = SessionStore(settings.session_store_dir) if settings.session_store_dir else None
+
+# Convenience functions
+def load_session_turns(session_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Convenience function for restoring a session's newest turns"""
+    return session_store.load(session_id, limit) if session_store else []
+
+def save_session_turn(session_id: str, turn: Dict[str, Any]):
+    """Convenience function for persisting a turn in the background"""
+    if session_store:
+        session_store.append(session_id, turn)
+
+def forget_session(session_id: str):
+    """Convenience function for deleting a session's persisted turns"""
+    if session_store:
+        session_store.forget(session_id)
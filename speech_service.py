@@ -6,20 +6,97 @@ Speech Service: Whisper STT + Azure TTS
 import io
 import logging
 import asyncio
-import tempfile
-import os
-from typing import Dict, Any, Optional
+import math
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from openai import OpenAI
 import azure.cognitiveservices.speech as speechsdk
 import numpy as np
 import soundfile as sf
 
-from config import settings
+from config import settings, CODESWITCHING_PATTERNS
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the app entrypoint
 logger = logging.getLogger(__name__)
 
+# Script presence checks; the search stops in C at the first matching character
+_ARABIC_CHAR_PATTERN = re.compile(r"[\u0600-\u06FF]")
+_ENGLISH_CHAR_PATTERN = re.compile(r"[A-Za-z]")
+
+# All code-switching indicators in one alternation, counted in a single pass
+_CODESWITCHING_PATTERN = re.compile("|".join(
+    re.escape(pattern.lower())
+    for patterns in CODESWITCHING_PATTERNS.values()
+    for pattern in patterns
+))
+
+# Common English words/phrases that should be marked in mixed SSML, applied in this order
+_SSML_ENGLISH_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'\b(I|you|me|my|your|the|and|or|but|so|very|really|actually|basically|literally)\b',
+        r'\b(okay|ok|yeah|yes|no|hello|hi|bye|thank you|thanks|sorry|excuse me)\b',
+        r'\b(family|work|job|school|university|hospital|doctor|teacher|student)\b',
+        r'\b(happy|sad|angry|tired|stressed|worried|excited|disappointed)\b',
+        r'\b(today|tomorrow|yesterday|now|later|morning|afternoon|evening|night)\b',
+        r'\b(problem|solution|situation|feeling|emotion|thought|idea|plan)\b'
+    )
+]
+_SSML_LANG_TAG_PATTERN = re.compile(r'(<lang xml:lang="en-US">.*?</lang>)')
+
+# Whisper resamples everything to 16 kHz mono before transcribing
+_WHISPER_SAMPLE_RATE = 16000
+
+@lru_cache(maxsize=None)
+def _decimation_filter(factor: float) -> np.ndarray:
+    """Hamming-windowed sinc low-pass that removes content above the decimated Nyquist rate"""
+    taps = 16 * math.ceil(factor) + 1
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(0.9 * n / factor) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+# Energy VAD: 20 ms frames more than 35 dB below the loudest frame count as silence, and a
+# margin is kept around the speech so soft word onsets and endings are not clipped
+_VAD_FRAME_SECONDS = 0.02
+_VAD_THRESHOLD_DB = -35.0
+_VAD_PADDING_SECONDS = 0.25
+# A recording whose loudest frame stays under this level (about 300 on the int16 scale) holds no speech
+_SPEECH_FLOOR_DB = -40.0
+
+def _frame_rms(data: np.ndarray, sample_rate: int) -> Tuple[int, np.ndarray]:
+    """Split mono audio into VAD frames, returning the frame length and each whole frame's RMS level"""
+    frame = max(1, int(sample_rate * _VAD_FRAME_SECONDS))
+    frame_count = len(data) // frame
+    return frame, np.sqrt(np.mean(np.square(data[:frame_count * frame].reshape(frame_count, frame)), axis=1))
+
+def _has_speech(data: np.ndarray, sample_rate: int) -> bool:
+    """Whether any frame of the recording is loud enough to be speech"""
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    _, frame_rms = _frame_rms(data, sample_rate)
+    return len(frame_rms) > 0 and frame_rms.max() >= 10 ** (_SPEECH_FLOOR_DB / 20)
+
+def _trim_silence(data: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Drop leading and trailing silence from mono audio"""
+    frame, frame_rms = _frame_rms(data, sample_rate)
+    if len(frame_rms) == 0:
+        return data
+    
+    peak = frame_rms.max()
+    if peak == 0:
+        return data
+    
+    voiced = np.flatnonzero(frame_rms > peak * 10 ** (_VAD_THRESHOLD_DB / 20))
+    padding = int(sample_rate * _VAD_PADDING_SECONDS)
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(data), (voiced[-1] + 1) * frame + padding)
+    return data[start:end]
+
+# Sentence ends in English and Arabic punctuation, where a reply can be split for synthesis
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?؟۔])\s+")
+
 class SpeechService:
     """Handles speech-to-text and text-to-speech operations"""
     
@@ -28,6 +105,13 @@ class SpeechService:
         self.openai_client = None
         self.azure_speech_config = None
         self.azure_synthesizer = None
+        # Synthesizers with an open service connection, reused so a turn skips the connection setup;
+        # the voice comes from the SSML, so any idle synthesizer serves any voice
+        self._idle_synthesizers: List[Any] = []
+        # Synthesized audio keyed by (voice, text); fallback and cached LLM replies repeat verbatim
+        self._tts_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        # Audio for fixed texts that must never wait on synthesis, kept outside the LRU
+        self._pinned_audio: Dict[Tuple[str, str], bytes] = {}
         self._initialize_services()
     
     def _initialize_services(self):
@@ -35,7 +119,7 @@ class SpeechService:
         try:
             # Initialize OpenAI Whisper API
             if settings.openai_api_key:
-                self.openai_client = OpenAI(api_key=settings.openai_api_key)
+                self.openai_client = OpenAI(api_key=settings.openai_api_key, timeout=settings.speech_timeout)
                 logger.info("OpenAI Whisper API client initialized successfully")
             else:
                 logger.warning("OpenAI API key not provided - STT will be disabled")
@@ -78,179 +162,169 @@ class SpeechService:
                     "processing_time": 0
                 }
             
-            start_time = asyncio.get_event_loop().time()
+            start_time = time.perf_counter()
             
-            # Create temporary file for API upload
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                try:
-                    # Simple audio analysis using soundfile (no FFmpeg required)
-                    try:
-                        # Try to read audio data for basic analysis
-                        with io.BytesIO(audio_data) as audio_buffer:
-                            data, sample_rate = sf.read(audio_buffer)
-                            
-                        # Basic audio analysis
-                        duration_seconds = len(data) / sample_rate
-                        avg_volume = np.mean(np.abs(data)) if len(data) > 0 else 0
-                        
-                        logger.info(f"🎵 Audio analysis: {duration_seconds:.1f}s, sample_rate: {sample_rate}Hz")
-                        
-                        # Check minimum duration
-                        if duration_seconds < 0.5:
-                            return {
-                                "success": False,
-                                "error": f"Audio too short ({duration_seconds:.1f}s) - minimum 0.5 seconds required",
-                                "text": "",
-                                "processing_time": asyncio.get_event_loop().time() - start_time,
-                                "audio_duration": duration_seconds,
-                                "audio_volume": avg_volume
-                            }
-                        
-                        # Check if audio is too quiet (likely noise or silence)
-                        if avg_volume < 0.001:
-                            logger.warning(f"⚠️ Audio very quiet: {avg_volume:.4f} - may cause incorrect language detection")
-                            return {
-                                "success": False,
-                                "error": f"Audio too quiet ({avg_volume:.4f}) - please speak louder and closer to microphone",
-                                "text": "",
-                                "processing_time": asyncio.get_event_loop().time() - start_time,
-                                "audio_duration": duration_seconds,
-                                "audio_volume": avg_volume
-                            }
-                        
-                        # Check if audio is too long (might contain multiple segments that confuse detection)
-                        if duration_seconds > 30:
-                            logger.warning(f"⚠️ Audio very long: {duration_seconds:.1f}s - may affect language detection accuracy")
-                            
-                    except Exception as audio_analysis_error:
-                        logger.warning(f"Could not analyze audio: {audio_analysis_error}")
-                        # Continue anyway - OpenAI Whisper API can handle various formats
-                        duration_seconds = 0
-                        avg_volume = 0
+            # Simple audio analysis using soundfile (no FFmpeg required)
+            data = None
+            try:
+                # Try to read audio data for basic analysis
+                with io.BytesIO(audio_data) as audio_buffer:
+                    data, sample_rate = sf.read(audio_buffer)
                     
-                    # Write audio data directly to temporary file
-                    temp_file.write(audio_data)
-                    temp_file.flush()
+                # Basic audio analysis
+                duration_seconds = len(data) / sample_rate
+                avg_volume = np.mean(np.abs(data)) if len(data) > 0 else 0
+                
+                logger.info(f"🎵 Audio analysis: {duration_seconds:.1f}s, sample_rate: {sample_rate}Hz")
+                
+                # Check minimum duration
+                if duration_seconds < 0.5:
+                    return {
+                        "success": False,
+                        "error": f"Audio too short ({duration_seconds:.1f}s) - minimum 0.5 seconds required",
+                        "text": "",
+                        "processing_time": time.perf_counter() - start_time,
+                        "audio_duration": duration_seconds,
+                        "audio_volume": avg_volume
+                    }
+                
+                # Check if audio is too quiet (likely noise or silence); an accidental tap or a
+                # recording of room noise fails here instead of costing a Whisper round-trip
+                if avg_volume < 0.001 or not _has_speech(data, sample_rate):
+                    logger.warning(f"⚠️ Audio very quiet: {avg_volume:.4f} - may cause incorrect language detection")
+                    return {
+                        "success": False,
+                        "error": f"Audio too quiet ({avg_volume:.4f}) - please speak louder and closer to microphone",
+                        "text": "",
+                        "processing_time": time.perf_counter() - start_time,
+                        "audio_duration": duration_seconds,
+                        "audio_volume": avg_volume
+                    }
+                
+                # Check if audio is too long (might contain multiple segments that confuse detection)
+                if duration_seconds > 30:
+                    logger.warning(f"⚠️ Audio very long: {duration_seconds:.1f}s - may affect language detection accuracy")
                     
-                    # Try code-switching aware transcription (auto-detect language)
-                    logger.info("🌐 Attempting code-switching transcription...")
+            except Exception as audio_analysis_error:
+                logger.warning(f"Could not analyze audio: {audio_analysis_error}")
+                # Continue anyway - OpenAI Whisper API can handle various formats
+                duration_seconds = 0
+                avg_volume = 0
+            
+            # Whisper works on 16 kHz mono and bills by duration, so send that, without the silent padding
+            upload_audio = audio_data
+            if data is not None:
+                upload_audio = await asyncio.to_thread(self._encode_for_whisper, data, sample_rate, audio_data)
+            
+            # Try code-switching aware transcription (auto-detect language)
+            logger.info("🌐 Attempting code-switching transcription...")
+            transcribed_text = ""
+            detected_language = "unknown"
+            
+            try:
+                # First attempt: Auto-detect language for code-switching
+                transcript = await self._run_blocking(
+                    self._transcribe_audio,
+                    upload_audio,
+                    # No language parameter = auto-detect
+                    response_format="verbose_json"
+                )
+                
+                transcribed_text = transcript.text.strip()
+                detected_language = transcript.language if hasattr(transcript, 'language') else "auto-detected"
+                
+                # FILTER OUT INCORRECT LANGUAGE DETECTIONS
+                # Only accept Arabic, English, or unknown detections
+                expected_languages = ["ar", "en", "arabic", "english", "auto-detected", "unknown"]
+                
+                if detected_language.lower() not in expected_languages:
+                    logger.warning(f"⚠️ Unexpected language detected: {detected_language} - forcing fallback")
+                    # Clear the result to force Arabic/English fallback
                     transcribed_text = ""
-                    detected_language = "unknown"
-                    
-                    try:
-                        # First attempt: Auto-detect language for code-switching
-                        with open(temp_file.name, "rb") as audio_file:
-                            transcript = self.openai_client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=audio_file,
-                                # No language parameter = auto-detect
-                                response_format="verbose_json"
-                            )
-                        
-                        transcribed_text = transcript.text.strip()
-                        detected_language = transcript.language if hasattr(transcript, 'language') else "auto-detected"
-                        
-                        # FILTER OUT INCORRECT LANGUAGE DETECTIONS
-                        # Only accept Arabic, English, or unknown detections
-                        expected_languages = ["ar", "en", "arabic", "english", "auto-detected", "unknown"]
-                        
-                        if detected_language.lower() not in expected_languages:
-                            logger.warning(f"⚠️ Unexpected language detected: {detected_language} - forcing fallback")
-                            # Clear the result to force Arabic/English fallback
-                            transcribed_text = ""
-                            detected_language = f"filtered-out-{detected_language}"
-                        elif transcribed_text:
-                            # Additional validation: reject very short or nonsensical results
-                            if len(transcribed_text.strip()) < 2:
-                                logger.warning(f"⚠️ Transcription too short ({len(transcribed_text)} chars) - trying fallback")
-                                transcribed_text = ""
-                            # Reject common Whisper artifacts/noise patterns
-                            elif transcribed_text.strip().lower() in ["uh", "um", "ah", "mm", "hm", ".", "!", "?", " "]:
-                                logger.warning(f"⚠️ Transcription appears to be noise/artifact: '{transcribed_text}' - trying fallback")
-                                transcribed_text = ""
-                            else:
-                                logger.info(f"✅ Auto-detect transcription: lang={detected_language}, text='{transcribed_text[:50]}...'")
-                        
-                    except Exception as auto_error:
-                        logger.warning(f"Auto-detect transcription failed: {auto_error}")
-                    
-                    # If auto-detect failed or empty, try Arabic-focused
-                    if not transcribed_text:
-                        logger.info("🔄 Trying Arabic-focused transcription...")
-                        try:
-                            with open(temp_file.name, "rb") as audio_file:
-                                transcript = self.openai_client.audio.transcriptions.create(
-                                    model="whisper-1",
-                                    file=audio_file,
-                                    language="ar",  # Arabic
-                                    response_format="text"
-                                )
-                            
-                            transcribed_text = transcript.strip() if isinstance(transcript, str) else transcript.text.strip()
-                            detected_language = "ar"
-                            
-                            if transcribed_text:
-                                logger.info(f"✅ Arabic transcription succeeded: '{transcribed_text[:50]}...'")
-                        
-                        except Exception as ar_error:
-                            logger.warning(f"Arabic transcription failed: {ar_error}")
-                    
-                    # If still empty, try English as final fallback
-                    if not transcribed_text:
-                        logger.info("🔄 Trying English fallback...")
-                        try:
-                            with open(temp_file.name, "rb") as audio_file:
-                                transcript = self.openai_client.audio.transcriptions.create(
-                                    model="whisper-1",
-                                    file=audio_file,
-                                    language="en",  # English
-                                    response_format="text"
-                                )
-                            
-                            transcribed_text = transcript.strip() if isinstance(transcript, str) else transcript.text.strip()
-                            detected_language = "en"
-                            
-                            if transcribed_text:
-                                logger.info(f"✅ English transcription succeeded: '{transcribed_text[:50]}...'")
-                        
-                        except Exception as en_error:
-                            logger.warning(f"English transcription failed: {en_error}")
+                    detected_language = f"filtered-out-{detected_language}"
+                elif transcribed_text:
+                    # Additional validation: reject very short or nonsensical results
+                    if len(transcribed_text.strip()) < 2:
+                        logger.warning(f"⚠️ Transcription too short ({len(transcribed_text)} chars) - trying fallback")
+                        transcribed_text = ""
+                    # Reject common Whisper artifacts/noise patterns
+                    elif transcribed_text.strip().lower() in ["uh", "um", "ah", "mm", "hm", ".", "!", "?", " "]:
+                        logger.warning(f"⚠️ Transcription appears to be noise/artifact: '{transcribed_text}' - trying fallback")
+                        transcribed_text = ""
+                    else:
+                        logger.info(f"✅ Auto-detect transcription: lang={detected_language}, text='{transcribed_text[:50]}...'")
+                
+            except Exception as auto_error:
+                logger.warning(f"Auto-detect transcription failed: {auto_error}")
+            
+            # If auto-detect failed or empty, try Arabic-focused
+            if not transcribed_text:
+                logger.info("🔄 Trying Arabic-focused transcription...")
+                try:
+                    transcript = await self._run_blocking(
+                        self._transcribe_audio,
+                        upload_audio,
+                        language="ar",  # Arabic
+                        response_format="text"
+                    )
                     
-                    # Final check - if still empty, return error
-                    if not transcribed_text:
-                        return {
-                            "success": False,
-                            "error": f"No speech detected in any language - Duration: {duration_seconds:.1f}s, Volume: {avg_volume:.4f}. Try speaking louder and longer.",
-                            "text": "",
-                            "processing_time": asyncio.get_event_loop().time() - start_time,
-                            "audio_duration": duration_seconds,
-                            "audio_volume": avg_volume,
-                            "whisper_info": "Auto-detect, Arabic, and English transcription all returned empty"
-                        }
+                    transcribed_text = transcript.strip() if isinstance(transcript, str) else transcript.text.strip()
+                    detected_language = "ar"
                     
-                    # Detect code-switching patterns
-                    is_codeswitching = self._detect_codeswitching(transcribed_text)
+                    if transcribed_text:
+                        logger.info(f"✅ Arabic transcription succeeded: '{transcribed_text[:50]}...'")
+                
+                except Exception as ar_error:
+                    logger.warning(f"Arabic transcription failed: {ar_error}")
+            
+            # If still empty, try English as final fallback
+            if not transcribed_text:
+                logger.info("🔄 Trying English fallback...")
+                try:
+                    transcript = await self._run_blocking(
+                        self._transcribe_audio,
+                        upload_audio,
+                        language="en",  # English
+                        response_format="text"
+                    )
                     
-                    processing_time = asyncio.get_event_loop().time() - start_time
+                    transcribed_text = transcript.strip() if isinstance(transcript, str) else transcript.text.strip()
+                    detected_language = "en"
                     
-                    return {
-                        "success": True,
-                        "text": transcribed_text,
-                        "language": detected_language,
-                        "is_codeswitching": is_codeswitching,
-                        "confidence": 0.95,  # OpenAI Whisper API doesn't provide confidence scores
-                        "processing_time": processing_time,
-                        "audio_duration": duration_seconds,
-                        "audio_volume": avg_volume,
-                        "api_used": "openai-whisper-api-codeswitching"
-                    }
+                    if transcribed_text:
+                        logger.info(f"✅ English transcription succeeded: '{transcribed_text[:50]}...'")
                 
-                finally:
-                    # Clean up temporary file
-                    try:
-                        os.unlink(temp_file.name)
-                    except:
-                        pass
+                except Exception as en_error:
+                    logger.warning(f"English transcription failed: {en_error}")
+            
+            # Final check - if still empty, return error
+            if not transcribed_text:
+                return {
+                    "success": False,
+                    "error": f"No speech detected in any language - Duration: {duration_seconds:.1f}s, Volume: {avg_volume:.4f}. Try speaking louder and longer.",
+                    "text": "",
+                    "processing_time": time.perf_counter() - start_time,
+                    "audio_duration": duration_seconds,
+                    "audio_volume": avg_volume,
+                    "whisper_info": "Auto-detect, Arabic, and English transcription all returned empty"
+                }
+            
+            # Detect code-switching patterns
+            is_codeswitching = self._detect_codeswitching(transcribed_text)
+            
+            processing_time = time.perf_counter() - start_time
+            
+            return {
+                "success": True,
+                "text": transcribed_text,
+                "language": detected_language,
+                "is_codeswitching": is_codeswitching,
+                "confidence": 0.95,  # OpenAI Whisper API doesn't provide confidence scores
+                "processing_time": processing_time,
+                "audio_duration": duration_seconds,
+                "audio_volume": avg_volume,
+                "api_used": "openai-whisper-api-codeswitching"
+            }
                 
         except Exception as e:
             logger.error(f"OpenAI Whisper API error: {e}")
@@ -280,38 +354,57 @@ class SpeechService:
                     "processing_time": 0
                 }
             
-            start_time = asyncio.get_event_loop().time()
+            start_time = time.perf_counter()
             
             # Use specified voice or default
             current_voice = voice_name or settings.tts_voice_female
-            self.azure_speech_config.speech_synthesis_voice_name = current_voice
             
-            # Create synthesizer
-            synthesizer = speechsdk.SpeechSynthesizer(
-                speech_config=self.azure_speech_config,
-                audio_config=None  # Return audio data instead of playing
-            )
+            cache_key = (current_voice, text)
+            cached_audio = self._pinned_audio.get(cache_key)
+            if cached_audio is None:
+                cached_audio = self._tts_cache.get(cache_key)
+                if cached_audio is not None:
+                    self._tts_cache.move_to_end(cache_key)
+            if cached_audio is not None:
+                return {
+                    "success": True,
+                    "audio_data": cached_audio,
+                    "voice_name": current_voice,
+                    "processing_time": time.perf_counter() - start_time,
+                    "text_length": len(text)
+                }
             
-            # Create SSML for better pronunciation
-            ssml_text = self._create_ssml(text, current_voice)
+            self.azure_speech_config.speech_synthesis_voice_name = current_voice
             
-            # Synthesize speech
-            result = synthesizer.speak_ssml_async(ssml_text).get()
+            # Long replies are split into sentence groups synthesized concurrently; the speaking
+            # rate follows the whole reply so every group sounds the same
+            is_codeswitching = _ARABIC_CHAR_PATTERN.search(text) is not None and _ENGLISH_CHAR_PATTERN.search(text) is not None
+            chunks = self._split_for_synthesis(text, settings.tts_max_parallel)
+            results = await asyncio.gather(*(
+                self._synthesize_ssml(self._create_ssml(chunk, current_voice, is_codeswitching))
+                for chunk in chunks
+            ))
             
-            processing_time = asyncio.get_event_loop().time() - start_time
+            processing_time = time.perf_counter() - start_time
             
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            failed = next((result for result in results if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted), None)
+            if failed is None:
+                if len(results) == 1:
+                    audio_data = results[0].audio_data
+                else:
+                    audio_data = await asyncio.to_thread(self._join_wav, [result.audio_data for result in results])
+                self._cache_audio(cache_key, audio_data)
                 return {
                     "success": True,
-                    "audio_data": result.audio_data,
+                    "audio_data": audio_data,
                     "voice_name": current_voice,
-                    "processing_time": processing_time,
+                    "processing_time": time.perf_counter() - start_time,
                     "text_length": len(text)
                 }
             else:
-                error_msg = f"TTS failed: {result.reason}"
-                if result.reason == speechsdk.ResultReason.Canceled:
-                    cancellation = result.cancellation_details
+                error_msg = f"TTS failed: {failed.reason}"
+                if failed.reason == speechsdk.ResultReason.Canceled:
+                    cancellation = failed.cancellation_details
                     error_msg += f" - {cancellation.reason}: {cancellation.error_details}"
                 
                 return {
@@ -328,13 +421,130 @@ class SpeechService:
                 "processing_time": 0
             }
     
-    def _create_ssml(self, text: str, voice_name: str) -> str:
+    async def _synthesize_ssml(self, ssml_text: str) -> Any:
+        """Synthesize one SSML document; the SDK's .get() blocks, so wait on it in the worker pool"""
+        synthesizer = self._idle_synthesizers.pop() if self._idle_synthesizers else self._create_synthesizer()
+        result = await self._run_blocking(synthesizer.speak_ssml_async(ssml_text).get)
+        # Only a synthesizer that finished is returned to the pool; a timed-out one may still be busy
+        if len(self._idle_synthesizers) < settings.tts_max_parallel:
+            self._idle_synthesizers.append(synthesizer)
+        return result
+    
+    def _create_synthesizer(self) -> Any:
+        """Create a synthesizer that returns audio data instead of playing it"""
+        return speechsdk.SpeechSynthesizer(
+            speech_config=self.azure_speech_config,
+            audio_config=None
+        )
+    
+    async def pin_speech(self, text: str, voice_name: Optional[str] = None) -> bool:
+        """Synthesize a fixed text once and keep its audio for the life of the process"""
+        result = await self.text_to_speech(text, voice_name)
+        if result["success"]:
+            self._pinned_audio[(voice_name or settings.tts_voice_female, text)] = result["audio_data"]
+        return result["success"]
+    
+    def warm_up(self):
+        """Pre-connect enough synthesizers for one reply's parallel groups so the first turn skips connection setup"""
+        if not self.azure_speech_config:
+            return
+        try:
+            while len(self._idle_synthesizers) < settings.tts_max_parallel:
+                synthesizer = self._create_synthesizer()
+                speechsdk.Connection.from_speech_synthesizer(synthesizer).open(True)
+                self._idle_synthesizers.append(synthesizer)
+            logger.info(f"Azure TTS pre-connected {len(self._idle_synthesizers)} synthesizers")
+        except Exception as e:
+            logger.warning(f"Azure TTS warm-up failed: {e}")
+    
+    @staticmethod
+    def _split_for_synthesis(text: str, max_chunks: int) -> List[str]:
+        """Pack sentences, in order, into at most `max_chunks` groups of similar length"""
+        sentences = [sentence for sentence in _SENTENCE_BOUNDARY_PATTERN.split(text.strip()) if sentence]
+        if max_chunks <= 1 or len(sentences) <= 1:
+            return [text]
+        
+        target_length = len(text) / min(max_chunks, len(sentences))
+        chunks: List[str] = []
+        current: List[str] = []
+        current_length = 0
+        for sentence in sentences:
+            current.append(sentence)
+            current_length += len(sentence)
+            if current_length >= target_length and len(chunks) < max_chunks - 1:
+                chunks.append(" ".join(current))
+                current, current_length = [], 0
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+    
+    @staticmethod
+    def _join_wav(parts: List[bytes]) -> bytes:
+        """Concatenate same-format WAV clips into one WAV"""
+        samples = []
+        for part in parts:
+            with io.BytesIO(part) as part_buffer:
+                data, sample_rate = sf.read(part_buffer, dtype="int16")
+            samples.append(data)
+        
+        with io.BytesIO() as output:
+            sf.write(output, np.concatenate(samples), sample_rate, format="WAV", subtype="PCM_16")
+            return output.getvalue()
+    
+    def _cache_audio(self, cache_key: Tuple[str, str], audio_data: bytes):
+        """Store synthesized audio, evicting the least recently used entry when full"""
+        if settings.tts_cache_size <= 0:
+            return
+        self._tts_cache[cache_key] = audio_data
+        if len(self._tts_cache) > settings.tts_cache_size:
+            self._tts_cache.popitem(last=False)
+    
+    @staticmethod
+    def _encode_for_whisper(data: np.ndarray, sample_rate: int, original: bytes) -> bytes:
+        """Downmix, resample to 16 kHz and trim silence into PCM16, keeping the original when that is no smaller"""
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+        if sample_rate > _WHISPER_SAMPLE_RATE:
+            factor = sample_rate / _WHISPER_SAMPLE_RATE
+            data = np.convolve(data, _decimation_filter(factor), mode="same")
+            if factor.is_integer():
+                data = data[::int(factor)]
+            else:
+                # 44.1 kHz and other non-multiples: the band-limited signal is smooth enough
+                # at 16 kHz output spacing for linear interpolation
+                positions = np.arange(int(len(data) / factor)) * factor
+                data = np.interp(positions, np.arange(len(data)), data)
+            sample_rate = _WHISPER_SAMPLE_RATE
+        data = _trim_silence(data, sample_rate)
+        
+        with io.BytesIO() as output:
+            sf.write(output, data, sample_rate, format="WAV", subtype="PCM_16")
+            encoded = output.getvalue()
+        return encoded if len(encoded) < len(original) else original
+    
+    def _transcribe_audio(self, audio_data: bytes, **kwargs: Any) -> Any:
+        """Blocking Whisper API call, uploading the recording straight from memory"""
+        return self.openai_client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.wav", audio_data),
+            **kwargs
+        )
+    
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking SDK call in the worker pool so the shared event loop keeps serving other sessions"""
+        return await asyncio.wait_for(
+            asyncio.to_thread(func, *args, **kwargs),
+            timeout=settings.speech_timeout
+        )
+    
+    def _create_ssml(self, text: str, voice_name: str, is_codeswitching: Optional[bool] = None) -> str:
         """Create enhanced SSML for better Arabic pronunciation and code-switching support"""
         
-        # Detect if text contains code-switching
-        has_arabic = any('\u0600' <= char <= '\u06FF' for char in text)
-        has_english = any(char.isalpha() and ord(char) < 128 for char in text)
-        is_codeswitching = has_arabic and has_english
+        # Detect if text contains code-switching, unless the caller already knows
+        if is_codeswitching is None:
+            has_arabic = _ARABIC_CHAR_PATTERN.search(text) is not None
+            has_english = _ENGLISH_CHAR_PATTERN.search(text) is not None
+            is_codeswitching = has_arabic and has_english
         
         if is_codeswitching:
             logger.info("🌐 Creating code-switching SSML")
@@ -374,32 +584,14 @@ class SpeechService:
         Returns:
             Enhanced SSML with language tags
         """
-        import re
-        
-        # Common English words/phrases that should be marked
-        english_patterns = [
-            r'\b(I|you|me|my|your|the|and|or|but|so|very|really|actually|basically|literally)\b',
-            r'\b(okay|ok|yeah|yes|no|hello|hi|bye|thank you|thanks|sorry|excuse me)\b',
-            r'\b(family|work|job|school|university|hospital|doctor|teacher|student)\b',
-            r'\b(happy|sad|angry|tired|stressed|worried|excited|disappointed)\b',
-            r'\b(today|tomorrow|yesterday|now|later|morning|afternoon|evening|night)\b',
-            r'\b(problem|solution|situation|feeling|emotion|thought|idea|plan)\b'
-        ]
-        
         enhanced_text = text
         
         # Mark common English words with language tags for better pronunciation
-        for pattern in english_patterns:
-            enhanced_text = re.sub(
-                pattern, 
-                lambda m: f'<lang xml:lang="en-US">{m.group()}</lang>',
-                enhanced_text,
-                flags=re.IGNORECASE
-            )
+        for pattern in _SSML_ENGLISH_PATTERNS:
+            enhanced_text = pattern.sub(r'<lang xml:lang="en-US">\g<0></lang>', enhanced_text)
         
         # Add slight pauses around language switches for more natural flow
-        enhanced_text = re.sub(
-            r'(<lang xml:lang="en-US">.*?</lang>)',
+        enhanced_text = _SSML_LANG_TAG_PATTERN.sub(
             r'<break time="0.1s"/>\1<break time="0.1s"/>',
             enhanced_text
         )
@@ -463,20 +655,11 @@ class SpeechService:
             return False
         
         # Simple heuristic: check if text contains both Arabic and English characters
-        has_arabic = any('\u0600' <= char <= '\u06FF' for char in text)
-        has_english = any(char.isalpha() and ord(char) < 128 for char in text)
-        
-        # Additional check for common code-switching patterns
-        from config import CODESWITCHING_PATTERNS
-        
-        text_lower = text.lower()
-        codeswitching_indicators = 0
+        has_arabic = _ARABIC_CHAR_PATTERN.search(text) is not None
+        has_english = _ENGLISH_CHAR_PATTERN.search(text) is not None
         
-        # Check for common code-switching patterns
-        for category, patterns in CODESWITCHING_PATTERNS.items():
-            for pattern in patterns:
-                if pattern.lower() in text_lower:
-                    codeswitching_indicators += 1
+        # Count distinct code-switching patterns in a single pass
+        codeswitching_indicators = len(set(_CODESWITCHING_PATTERN.findall(text.lower())))
         
         # If we have both Arabic and English, or multiple code-switching indicators
         is_mixed = (has_arabic and has_english) or codeswitching_indicators >= 2
@@ -498,6 +681,18 @@ async def synthesize_speech(text: str, voice_name: Optional[str] = None) -> Dict
     """Convenience function for text-to-speech"""
     return await speech_service.text_to_speech(text, voice_name)
 
+async def warm_up_speech_connections():
+    """Convenience function to pre-connect TTS off the event loop"""
+    await asyncio.to_thread(speech_service.warm_up)
+
+async def pin_speech(text: str, voice_name: Optional[str] = None) -> bool:
+    """Convenience function for pre-synthesizing a fixed text"""
+    return await speech_service.pin_speech(text, voice_name)
+
+async def join_speech_audio(clips: List[bytes]) -> bytes:
+    """Convenience function for concatenating synthesized clips off the event loop"""
+    return await asyncio.to_thread(SpeechService._join_wav, clips)
+
 def test_speech_services() -> Dict[str, Any]:
     """Convenience function to test speech services"""
     return speech_service.test_services() 
\ No newline at end of file